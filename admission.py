@@ -0,0 +1,239 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+# Absolute time.monotonic() deadline of the request running in this context
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed: the queue is full or no slot freed up before its deadline."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs out of time before (or while waiting for) an LLM call."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Give the code in the block (and the threads it hands its context to) seconds to finish."""
+    token = _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Return the seconds left before the current request's deadline, or None without one."""
+    end = _deadline.get()
+    return end - time.monotonic() if end is not None else None
+
+
+def check_deadline(wait: float = 0.0):
+    """Raise DeadlineExceeded if the current request cannot wait `wait` more seconds."""
+    left = time_left()
+    if left is not None and left < wait:
+        raise DeadlineExceeded(f"Request deadline exceeded ({left:.2f}s left, {wait:.2f}s needed)")
+
+
+class AdmissionController:
+    """Admits requests to the LLM graph with a concurrency cap, a bounded queue and deadlines.
+
+    At most max_concurrent requests run at once and at most max_queue wait for
+    a slot; further requests are shed at once, and a queued request is shed
+    when no slot frees up before its deadline. Admitted requests run with
+    what is left of that deadline. Their latencies and failures over the last
+    `window` seconds are tracked: when the p95 latency exceeds latency_budget
+    or the failure rate exceeds error_budget, the controller reports overload
+    so callers can answer without the LLM, letting one request in probe_every
+    through to notice recovery.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64, timeout: float = 30.0,
+                 latency_budget: float = 10.0, error_budget: float = 0.25, window: float = 30.0,
+                 min_samples: int = 5, probe_every: int = 10):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.latency_budget = latency_budget
+        self.error_budget = error_budget
+        self.window = window
+        self.min_samples = min_samples
+        self.probe_every = max(1, probe_every)
+        self._slots = threading.Semaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        # (finished at, latency, failed) per LLM request in the window
+        self.samples: Deque[Tuple[float, float, bool]] = deque()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.failed = 0
+        self.degraded = 0
+        self.overloaded = False
+        self._checked_at = 0.0
+        self._skipped = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Configure from AGENT_MAX_CONCURRENT, AGENT_MAX_QUEUE, AGENT_DEADLINE, AGENT_LATENCY_BUDGET and AGENT_ERROR_BUDGET."""
+        return cls(
+            max_concurrent=int(os.getenv("AGENT_MAX_CONCURRENT", "16")),
+            max_queue=int(os.getenv("AGENT_MAX_QUEUE", "64")),
+            timeout=float(os.getenv("AGENT_DEADLINE", "30")),
+            latency_budget=float(os.getenv("AGENT_LATENCY_BUDGET", "10")),
+            error_budget=float(os.getenv("AGENT_ERROR_BUDGET", "0.25"))
+        )
+
+    def _enqueue(self):
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.shed += 1
+                raise Overloaded(f"Admission queue full ({self.max_queue} waiting)")
+            self.queued += 1
+
+    def _dequeue(self):
+        with self._lock:
+            self.queued -= 1
+
+    def _admitted(self, acquired: bool):
+        with self._lock:
+            if not acquired:
+                self.shed += 1
+                raise Overloaded(f"No slot freed up within {self.timeout:g}s")
+            self.in_flight += 1
+            self.admitted += 1
+
+    def acquire(self) -> float:
+        """Wait for a slot and return the time left of the request's deadline; raise Overloaded if shed."""
+        start = time.monotonic()
+        # Only requests that find no free slot count against the queue
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            self._enqueue()
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                self._dequeue()
+        self._admitted(acquired)
+        return self.timeout - (time.monotonic() - start)
+
+    async def aacquire(self) -> float:
+        """Async variant of acquire(): polls for a slot with asyncio.sleep, so no executor thread waits.
+
+        Slots are shared with acquire(). A slot is only taken between awaits,
+        so cancelling the wait never leaves one held.
+        """
+        start = time.monotonic()
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            self._enqueue()
+            try:
+                delay = 0.001
+                while not acquired:
+                    left = self.timeout - (time.monotonic() - start)
+                    if left <= 0:
+                        break
+                    await asyncio.sleep(min(delay, left))
+                    delay = min(delay * 2, 0.05)
+                    acquired = self._slots.acquire(blocking=False)
+            finally:
+                self._dequeue()
+        self._admitted(acquired)
+        return self.timeout - (time.monotonic() - start)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Hold a slot for the block, which runs under the request's remaining deadline."""
+        left = self.acquire()
+        try:
+            with deadline(left):
+                yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aadmit(self):
+        """Async variant of admit(); waiting for a slot does not block the event loop or an executor thread."""
+        left = await self.aacquire()
+        try:
+            with deadline(left):
+                yield
+        finally:
+            self.release()
+
+    def record(self, latency: float, failed: bool = False):
+        """Record the latency of an LLM-backed request and whether it failed from overload."""
+        with self._lock:
+            self.samples.append((time.monotonic(), latency, failed))
+            if failed:
+                self.failed += 1
+
+    def record_degraded(self):
+        """Count a request answered without the LLM."""
+        with self._lock:
+            self.degraded += 1
+
+    def _evaluate(self, now: float):
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        if len(self.samples) < self.min_samples:
+            self.overloaded = False
+            return
+        latencies = sorted(latency for _, latency, _ in self.samples)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        error_rate = sum(failed for _, _, failed in self.samples) / len(self.samples)
+        self.overloaded = p95 > self.latency_budget or error_rate > self.error_budget
+
+    def should_degrade(self) -> bool:
+        """Return True if this request should skip the LLM because the latency or error budget is exceeded."""
+        with self._lock:
+            now = time.monotonic()
+            # Re-evaluated at most once a second, not per request
+            if now - self._checked_at >= 1.0:
+                self._checked_at = now
+                self._evaluate(now)
+            if not self.overloaded:
+                return False
+            self._skipped += 1
+            return self._skipped % self.probe_every != 0
+
+    def stats(self) -> Dict[str, float]:
+        """Return the overload state, queue and slot usage, and request counters."""
+        with self._lock:
+            self._evaluate(time.monotonic())
+            latencies = sorted(latency for _, latency, _ in self.samples)
+            return {
+                "overloaded": self.overloaded,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "failed": self.failed,
+                "degraded": self.degraded,
+                "p95_latency_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+                "error_rate": sum(failed for _, _, failed in self.samples) / len(self.samples) if self.samples else 0.0
+            }
+
+    def render_metrics(self, prefix: str = "support_agent") -> str:
+        """Return the stats in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = []
+        for name, kind in (("overloaded", "gauge"), ("in_flight", "gauge"), ("queued", "gauge"),
+                           ("admitted", "counter"), ("shed", "counter"), ("failed", "counter"),
+                           ("degraded", "counter"), ("p95_latency_s", "gauge"), ("error_rate", "gauge")):
+            metric = f"{prefix}_admission_{name}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {float(stats[name]):g}")
+        return "\n".join(lines) + "\n"
@@ -1,20 +1,134 @@
+import asyncio
+import itertools
 import os
-from typing import Dict, List, Tuple, Any, Optional, Annotated, TypedDict
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple, Any, Optional, Annotated, TypedDict, Literal, Iterator, Union
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
-from langgraph.graph import END, StateGraph
+from langchain_core.callbacks import BaseCallbackHandler
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+from bm25 import BM25Index
+from cache import ResponseCache, normalize_query
+from catalog import ColumnarCatalog
+from context import build_product_context
 from data import products, orders
+from inventory import ChangeEvent, InventoryFeed
+from memory import ConversationMemory
+from order_store import OrderRepository
+from prerouter import PreRouter
+from ratelimit import LLMGateway, is_retryable, streaming
+from search import ProductIndex
+from speculation import Speculator
+from storage import SQLiteStore
+from templates import FastResponder, render_data_only
+from tracing import RequestTrace, Tracer
+
+if TYPE_CHECKING:
+    from langgraph.graph import StateGraph
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the Groq LLM
-llm = ChatGroq(
-    api_key=os.getenv("GROQ_API_KEY"),
-    model="llama3-70b-8192"
-)
+# The Groq client, its compiled chains and the default graph are created on
+# first use (see get_llm, get_chains and get_agent), so importing this module
+# stays cheap and does not need GROQ_API_KEY
+_init_lock = threading.RLock()
+_llms: Dict[str, Any] = {}
+_chains = None
+_agent = None
+
+# Model per tier: the classifiers and extractors only answer with a label or
+# an id, so they run on a smaller, faster model than the customer-facing answers
+MODEL_TIERS = {
+    "small": os.getenv("AGENT_SMALL_MODEL", "llama3-8b-8192"),
+    "large": os.getenv("AGENT_LARGE_MODEL", "llama3-70b-8192")
+}
+
+# Routing mode used by the module-level graph: "chained" runs the separate
+# classifier/extractor calls, "structured" makes one routing call
+ROUTING_MODE = os.getenv("AGENT_ROUTING_MODE", "chained")
+
+# Catalog and order store: "memory" joins data.py once at load time, "sqlite"
+# reads AGENT_DB_PATH (seeded from data.py when empty) so updates show up live,
+# over at most AGENT_DB_POOL connections
+STORAGE_BACKEND = os.getenv("AGENT_STORAGE", "memory")
+if STORAGE_BACKEND == "sqlite":
+    store = SQLiteStore(os.getenv("AGENT_DB_PATH", "support.db"), pool_size=int(os.getenv("AGENT_DB_POOL", "8")))
+    if store.is_empty():
+        store.load(products, orders)
+elif STORAGE_BACKEND == "memory":
+    store = OrderRepository(orders, products)
+else:
+    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
+
+# The search structures below are built from the store's rows, so a database
+# updated by another worker or an earlier run is indexed with its current
+# prices and stock, not with data.py
+catalog_products = store.all_products()
+
+# Rule-based fast path for queries with literal order numbers or product names
+PRE_ROUTE = os.getenv("AGENT_PRE_ROUTE", "1") != "0"
+columnar_catalog = ColumnarCatalog(catalog_products)
+pre_router = PreRouter(catalog_products, catalog=columnar_catalog)
+
+# Product search index, built once at startup
+product_index = ProductIndex(catalog_products)
+
+# BM25 index over descriptions and specs for feature questions such as "best
+# camera"; loaded from AGENT_BM25_PATH when it still matches the catalog
+feature_index = BM25Index.load_or_build(catalog_products, os.getenv("AGENT_BM25_PATH"))
+
+# Response and node-output caches; set AGENT_CACHE=0 to disable
+CACHE_ENABLED = os.getenv("AGENT_CACHE", "1") != "0"
+CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "300"))
+
+# Per-node tracing, configured with AGENT_TRACING (off by default)
+tracer = Tracer.from_env()
+
+# Every LLM call goes through the gateway: coalescing, rate limits, retries and
+# a concurrency cap, configured with AGENT_LLM_CONCURRENCY/RPM/TPM/RETRIES
+llm_gateway = LLMGateway.from_env()
+
+# Speculative mode: the classifier nodes start the likely extraction call at
+# the same time as their own call when a cheap prior (order number, gazetteer
+# hit, product words) suggests it will be needed; set AGENT_SPECULATE=1
+SPECULATE = os.getenv("AGENT_SPECULATE", "0") == "1"
+speculator = Speculator(int(os.getenv("AGENT_SPECULATE_WORKERS", "8")))
+
+# Fast responses: stock, price and order status questions about a single
+# record are rendered from templates without an LLM generation; set
+# AGENT_FAST_RESPONSES=1. fast_responder.stats() reports the share rendered
+FAST_RESPONSES = os.getenv("AGENT_FAST_RESPONSES", "0") == "1"
+fast_responder = FastResponder(catalog=columnar_catalog)
+
+# Admission control: bounded concurrency and queue, per-request deadlines, and
+# data-only answers once the LLM latency or error budget is exceeded,
+# configured with AGENT_MAX_CONCURRENT/MAX_QUEUE/DEADLINE/LATENCY_BUDGET/
+# ERROR_BUDGET; set AGENT_ADMISSION=0 to disable
+admission = AdmissionController.from_env() if os.getenv("AGENT_ADMISSION", "1") != "0" else None
+
+# Default number of graph runs in flight for process_queries
+BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "8"))
+
+# Multi-match prompts list at most this many products within this many tokens
+CONTEXT_TOP_K = int(os.getenv("AGENT_CONTEXT_TOP_K", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKENS", "400"))
+
+# Name searches keep at most this many best matches; a broad query such as
+# "samsung" on a large catalog would otherwise fetch and rank every match
+SEARCH_LIMIT = int(os.getenv("AGENT_SEARCH_LIMIT", "50"))
+
+# Multi-order prompts list at most this many orders, most recent first
+ORDER_LIMIT = int(os.getenv("AGENT_ORDER_LIMIT", "10"))
+
+# Prompt text for the shipping address of orders looked up by customer name
+ADDRESS_WITHHELD = "Not shown (looked up by name; the customer can ask with the order number)"
 
 # Define the state for our graph
 class AgentState(TypedDict):
@@ -22,13 +136,169 @@ class AgentState(TypedDict):
     user_input: str
     product_info: Optional[List[Dict]]
     order_info: Optional[Dict]
+    order_list: Optional[List[Dict]]
     response: Optional[str]
+    product_name: Optional[str]
+    order_id: Optional[str]
+    customer_name: Optional[str]
+    history: Optional[str]
 
-def should_retrieve_product_info(state: AgentState) -> Dict[str, str]:
-    """Determine if we need to retrieve product information based on user input."""
-    # Using the LLM to decide if this is a product-related query
-    prompt = ChatPromptTemplate.from_template(
-        """Determine if the following customer query is asking about a specific mobile phone product.
+class RouteDecision(BaseModel):
+    """Intent and entities extracted from a query in a single LLM call."""
+    intent: Literal["product", "order", "general"] = Field(
+        description="'product' for questions about a phone, 'order' for questions about an order, otherwise 'general'"
+    )
+    product_name: Optional[str] = Field(
+        default=None,
+        description="The phone product name or type the customer asks about, e.g. 'iPhone 15 Pro' or 'Google Pixel'"
+    )
+    order_id: Optional[str] = Field(
+        default=None,
+        description="The order numbers mentioned in the query, comma-separated, e.g. 'ORD10001' or 'ORD10001, ORD10003'"
+    )
+    customer_name: Optional[str] = Field(
+        default=None,
+        description="The customer's name when they ask about their orders without an order number, e.g. 'John Smith'"
+    )
+
+class AnswerWatcher(BaseCallbackHandler):
+    """Callback handler setting an event on the first token of the answer (generate_response's LLM call)."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+        self.runs = set()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        if metadata and metadata.get("langgraph_node") == "generate_response":
+            self.runs.add(run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if token and run_id in self.runs:
+            self.event.set()
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Callback handler counting the LLM calls made while processing queries."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
+
+def find_products(product_name: str, limit: Optional[int] = SEARCH_LIMIT) -> Optional[List[Dict]]:
+    """Return the products matching the given product name, best matches first.
+    
+    Returns [] when the name is a brand or model we don't stock ("iPhone 16")
+    and None when it names no product at all ("something with a stylus").
+    """
+    # The index finds the products; their current stock and price come from the store
+    matches = product_index.lookup(product_name, limit=limit)
+    if matches is None:
+        return None
+    return store.get_products([product["id"] for product in matches])
+
+def current_products(products: List[Dict], filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+    """Return the store's current records of the products, minus those no longer satisfying the filters."""
+    records = store.get_products([product["id"] for product in products])
+    if filters:
+        # The catalog columns can lag writes made by other workers
+        records = [record for record in records if columnar_catalog.satisfies(record, filters)]
+    return records
+
+def find_by_attributes(query: str) -> List[Dict]:
+    """Return the products satisfying price, storage or screen filters in the query, cheapest first."""
+    filters = pre_router.attribute_filters(query)
+    if filters is None:
+        return []
+    return current_products(columnar_catalog.filter(filters, limit=pre_router.attribute_limit), filters)
+
+def find_by_features(query: str, limit: int = 5) -> List[Dict]:
+    """Return the products whose description or specs best match the query's feature words."""
+    matches = feature_index.search(query, limit)
+    return store.get_products([product["id"] for product in matches])
+
+def find_matching_products(product_name: str, query: str) -> List[Dict]:
+    """Search by product name, then by the query's attribute filters, then by its feature words.
+    
+    The fallbacks only run when no brand or model is named: a named product we
+    don't stock is reported as not found rather than answered with another one.
+    """
+    named = find_products(product_name)
+    if named is not None:
+        return named
+    return find_by_attributes(query) or find_by_features(query)
+
+def find_order(order_number: str) -> Optional[Dict]:
+    """Return the order with its product details attached, or None."""
+    return store.get(order_number)
+
+def find_orders(order_numbers: List[str]) -> List[Dict]:
+    """Return the existing orders among the order numbers, fetched with their product details in one lookup."""
+    return store.get_many(order_numbers)
+
+def find_customer_orders(customer_name: str) -> List[Dict]:
+    """Return a customer's orders, most recent first."""
+    return sorted(store.find_by_customer(customer_name), key=lambda order: order["order_date"], reverse=True)
+
+def parse_order_reference(text: str) -> Dict[str, str]:
+    """Parse extractor output into {"order_id": "ORD1, ORD2"} or {"customer_name": ...}, or {} if neither."""
+    order_ids = pre_router.match_order_ids(text)
+    if order_ids:
+        return {"order_id": ", ".join(order_ids)}
+    if text.upper().startswith("CUSTOMER:"):
+        customer_name = text.split(":", 1)[1].strip()
+        return {"customer_name": customer_name} if customer_name else {}
+    if text and text != "NO_ORDER_NUMBER":
+        # An order number in some other format, looked up as written
+        return {"order_id": text}
+    return {}
+
+def order_state(orders: List[Dict]) -> Dict[str, Any]:
+    """Put one order in order_info and several in order_list."""
+    return {
+        "order_info": orders[0] if len(orders) == 1 else None,
+        "order_list": orders if len(orders) > 1 else None
+    }
+
+def lookup_orders(reference: Dict[str, str]) -> Dict[str, Any]:
+    """Fetch the orders an order reference names: every listed order number, or all of a customer's orders."""
+    order_id = reference.get("order_id")
+    if order_id:
+        order_ids = pre_router.match_order_ids(order_id) or [order_id]
+        return order_state(find_orders(order_ids))
+    customer_name = reference.get("customer_name")
+    if customer_name:
+        # The typed name is the only identity check, so shipping addresses are
+        # left out; asking with an order number shows them
+        return order_state([{**order, "shipping_address": None} for order in find_customer_orders(customer_name)])
+    return order_state([])
+
+def order_line(order: Dict) -> str:
+    """Return a one-line summary of an order for multi-order prompts."""
+    product_name = order.get("product_details", {}).get("name", "Unknown product")
+    tracking = f", tracking {order['tracking_number']}" if order["tracking_number"] else ""
+    shipping = f", shipping to {order['shipping_address']}" if order["shipping_address"] else ""
+    return (f"- {order['order_id']}: {product_name} x{order['quantity']}, {order['status']}{tracking}, "
+            f"ordered {order['order_date']}{shipping}")
+
+# Prompt templates; compile_chains parses them and composes them with a model once per graph
+ROUTE_PROMPT = """You route customer queries for a mobile phone retailer.
+        
+        Customer query: {query}
+        
+        Set intent to "product" if the customer is asking about a specific phone, its availability, price, features, etc.
+        Set intent to "order" if the customer is asking about an order status, tracking information, or mentions an order number.
+        Otherwise set intent to "general".
+        
+        If a phone product name or type is mentioned, set product_name to it (e.g. "iPhone 15 Pro", "Google Pixel").
+        If order numbers are mentioned, set order_id to them exactly as written, comma-separated (e.g. "ORD10001" or "ORD10001, ORD10003").
+        If the customer asks about their orders without an order number and gives their name, set customer_name to it.
+        Leave fields empty when they are not mentioned."""
+
+CHECK_PRODUCT_PROMPT = """Determine if the following customer query is asking about a specific mobile phone product.
         
         Customer query: {query}
         
@@ -42,21 +312,8 @@ def should_retrieve_product_info(state: AgentState) -> Dict[str, str]:
         respond with "NO".
         
         Respond with just "RETRIEVE_PRODUCT" or "NO"."""
-    )
-    
-    chain = prompt | llm
-    result = chain.invoke({"query": state["user_input"]}).content.strip()
-    
-    if "RETRIEVE_PRODUCT" in result:
-        return {"next": "retrieve_product"}
-    else:
-        return {"next": "next_step"}
 
-def should_retrieve_order_info(state: AgentState) -> Dict[str, str]:
-    """Determine if we need to retrieve order information based on user input."""
-    # Using the LLM to decide if this is an order-related query
-    prompt = ChatPromptTemplate.from_template(
-        """Determine if the following customer query is asking about a specific order.
+CHECK_ORDER_PROMPT = """Determine if the following customer query is asking about a specific order.
         
         Customer query: {query}
         
@@ -66,21 +323,8 @@ def should_retrieve_order_info(state: AgentState) -> Dict[str, str]:
         If the query is not about an order, respond with "NO".
         
         Respond with just "RETRIEVE_ORDER" or "NO"."""
-    )
-    
-    chain = prompt | llm
-    result = chain.invoke({"query": state["user_input"]}).content.strip()
-    
-    if "RETRIEVE_ORDER" in result:
-        return {"next": "retrieve_order"}
-    else:
-        return {"next": "generate_response"}
 
-def retrieve_product_info(state: AgentState) -> AgentState:
-    """Extract product name from query and retrieve product information."""
-    # Using the LLM to extract the product name
-    product_extract_prompt = ChatPromptTemplate.from_template(
-        """Extract the mobile phone product name or description from the following customer query.
+EXTRACT_PRODUCT_PROMPT = """Extract the mobile phone product name or description from the following customer query.
         Only extract the product name or type that the customer is asking about.
         
         Customer query: {query}
@@ -91,30 +335,9 @@ def retrieve_product_info(state: AgentState) -> AgentState:
         - If query is "Tell me about Google Pixel phones", output "Google Pixel"
         
         Output just the product name or product type, nothing else."""
-    )
-    
-    chain = product_extract_prompt | llm
-    product_name = chain.invoke({"query": state["user_input"]}).content.strip()
-    
-    # Search for the product in our inventory
-    matched_products = []
-    for product in products:
-        # Check if product name is in the product's name or brand
-        if (product_name.lower() in product["name"].lower() or 
-            product_name.lower() in product["brand"].lower()):
-            matched_products.append(product)
-    
-    # Update state with product info
-    new_state = state.copy()
-    new_state["product_info"] = matched_products if matched_products else None
-    return new_state
-
-def retrieve_order_info(state: AgentState) -> AgentState:
-    """Extract order number from query and retrieve order information."""
-    # Using the LLM to extract the order number
-    order_extract_prompt = ChatPromptTemplate.from_template(
-        """Extract the order number from the following customer query.
-        Only extract the order number that the customer is asking about.
+
+EXTRACT_ORDER_PROMPT = """Extract the order numbers from the following customer query.
+        Only extract the order numbers that the customer is asking about.
         
         Customer query: {query}
         
@@ -122,66 +345,13 @@ def retrieve_order_info(state: AgentState) -> AgentState:
         - If query is "What's the status of order ORD10001?", output "ORD10001"
         - If query is "When will my order #ORD10003 arrive?", output "ORD10003"
         - If query is "I want to know about order number ORD10002", output "ORD10002"
+        - If query is "Where are ORD10001 and ORD10004?", output "ORD10001, ORD10004"
+        - If query is "I'm Emma Johnson, where are all my orders?", output "CUSTOMER: Emma Johnson"
         
-        Output just the order number, nothing else. If no specific order number is mentioned, output "NO_ORDER_NUMBER"."""
-    )
-    
-    chain = order_extract_prompt | llm
-    order_number = chain.invoke({"query": state["user_input"]}).content.strip()
-    
-    new_state = state.copy()
-    
-    if order_number == "NO_ORDER_NUMBER":
-        new_state["order_info"] = None
-        return new_state
-    
-    # Search for the order in our database
-    matched_order = None
-    for order in orders:
-        if order["order_id"] == order_number:
-            matched_order = order.copy()
-            # Add product details to the order
-            for product in products:
-                if product["id"] == order["product_id"]:
-                    matched_order["product_details"] = product
-                    break
-            break
-    
-    # Update state with order info
-    new_state["order_info"] = matched_order
-    return new_state
-
-def generate_response(state: AgentState) -> AgentState:
-    """Generate a response based on the current state."""
-    new_state = state.copy()
-    
-    if state.get("product_info"):
-        product_info_str = ""
-        product_info = state["product_info"]
-        
-        if not product_info:  # No products found
-            response_prompt = ChatPromptTemplate.from_template(
-                """You are a helpful customer service agent for a mobile phone retailer.
-                The customer asked: "{query}"
-                
-                We don't have any products matching their description in our inventory.
-                
-                Provide a helpful response informing them that we don't have the product they're looking for.
-                Suggest they check out other phones we have available and mention a couple of alternatives from our inventory.
-                Be polite and professional."""
-            )
-            
-            chain = response_prompt | llm
-            response = chain.invoke({
-                "query": state["user_input"]
-            }).content
-            
-        elif len(product_info) == 1:  # Single product match
-            product = product_info[0]
-            availability = "In Stock" if product["stock"] > 0 else "Out of Stock"
-            
-            response_prompt = ChatPromptTemplate.from_template(
-                """You are a helpful customer service agent for a mobile phone retailer.
+        Output just the order numbers, comma-separated, nothing else. If no order number is mentioned but the customer
+        gives their name, output "CUSTOMER: " followed by the name. Otherwise output "NO_ORDER_NUMBER"."""
+
+SINGLE_PRODUCT_PROMPT = """You are a helpful customer service agent for a mobile phone retailer.
                 The customer asked: "{query}"
                 
                 We have the following product that matches their query:
@@ -196,27 +366,8 @@ def generate_response(state: AgentState) -> AgentState:
                 If they're asking about availability and the product is out of stock, apologize and suggest when it might be back in stock.
                 Be polite, professional, and stick to the facts about the product. 
                 DO NOT make up information not provided above."""
-            )
-            
-            chain = response_prompt | llm
-            response = chain.invoke({
-                "query": state["user_input"],
-                "name": product["name"],
-                "brand": product["brand"],
-                "price": product["price"],
-                "availability": availability,
-                "stock": product["stock"],
-                "description": product["description"],
-                "specs": str(product["specs"])
-            }).content
-            
-        else:  # Multiple product matches
-            for product in product_info:
-                availability = "In Stock" if product["stock"] > 0 else "Out of Stock"
-                product_info_str += f"- {product['name']} ({product['brand']}): ${product['price']}, {availability} ({product['stock']} units)\n"
-            
-            response_prompt = ChatPromptTemplate.from_template(
-                """You are a helpful customer service agent for a mobile phone retailer.
+
+MULTI_PRODUCT_PROMPT = """You are a helpful customer service agent for a mobile phone retailer.
                 The customer asked: "{query}"
                 
                 We have several products that match their query:
@@ -227,21 +378,8 @@ def generate_response(state: AgentState) -> AgentState:
                 If they're asking generally, give an overview of the options.
                 Be polite, professional, and stick to the facts about the products.
                 DO NOT make up information not provided above."""
-            )
-            
-            chain = response_prompt | llm
-            response = chain.invoke({
-                "query": state["user_input"],
-                "product_info": product_info_str
-            }).content
-    
-    elif state.get("order_info"):
-        # Generate response about the order
-        order = state["order_info"]
-        product_details = order.get("product_details", {})
-        
-        response_prompt = ChatPromptTemplate.from_template(
-            """You are a helpful customer service agent for a mobile phone retailer.
+
+ORDER_PROMPT = """You are a helpful customer service agent for a mobile phone retailer.
             The customer asked: "{query}"
             
             We found the following order information:
@@ -257,11 +395,411 @@ def generate_response(state: AgentState) -> AgentState:
             Provide a helpful response addressing their query about this order.
             Be polite, professional, and stick to the facts about the order.
             DO NOT make up information not provided above."""
+
+ORDERS_PROMPT = """You are a helpful customer service agent for a mobile phone retailer.
+            The customer asked: "{query}"
+            
+            We found the following orders:
+            {order_info}
+            
+            Provide a helpful response summarizing these orders and addressing their query.
+            Be polite, professional, and stick to the facts about the orders.
+            DO NOT make up information not provided above."""
+
+GENERAL_PROMPT = """You are a helpful customer service agent for a mobile phone retailer.
+            The customer asked: "{query}"
+            
+            We couldn't find specific product or order information related to their query.
+            
+            Provide a helpful general response. If they're asking about products or services we offer,
+            give them general information about our mobile phone retail business.
+            
+            Be polite and professional. Ask clarifying questions if needed.
+            DO NOT make up specific products or prices."""
+
+def record_versions(state: AgentState) -> Tuple:
+    """Return the product/order records a response was built from with their mutable fields."""
+    deps = []
+    for product in state.get("product_info") or ():
+        deps.append(("product", product["id"], product["stock"], product["price"]))
+    orders = state.get("order_list") or ([state["order_info"]] if state.get("order_info") else [])
+    for order in orders:
+        deps.append(("order", order["order_id"], order["status"], order["tracking_number"]))
+    return tuple(deps)
+
+def records_unchanged(deps: Tuple) -> bool:
+    """Check that the records behind a cached response still have the same stock, price and status."""
+    for kind, record_id, *fields in deps:
+        if kind == "product":
+            product = store.get_product(record_id)
+            if product is None or [product["stock"], product["price"]] != fields:
+                return False
+        else:
+            order = store.get(record_id)
+            if order is None or [order["status"], order["tracking_number"]] != fields:
+                return False
+    return True
+
+# Responses are indexed by the ("product" | "order", id) records they were built from
+response_cache = ResponseCache(
+    CACHE_SIZE, CACHE_TTL, validate=records_unchanged, dep_key=lambda dep: dep[:2]
+) if CACHE_ENABLED else None
+node_cache = ResponseCache(CACHE_SIZE, CACHE_TTL) if CACHE_ENABLED else None
+
+def clear_caches():
+    """Drop all cached responses and node outputs."""
+    for cache in (response_cache, node_cache):
+        if cache is not None:
+            cache.clear()
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    """Return the hit/miss/eviction stats of the response and node-output caches."""
+    return {
+        "responses": response_cache.stats() if response_cache is not None else {},
+        "nodes": node_cache.stats() if node_cache is not None else {}
+    }
+
+# Node cache key of each live chain, by id(chain). Ids are reused once a chain
+# is garbage-collected, so each entry keeps a weak reference to check against
+_chain_keys: Dict[int, Tuple[weakref.ref, int]] = {}
+_chain_counter = itertools.count()
+_chain_keys_lock = threading.Lock()
+
+def chain_key(chain) -> int:
+    """Return a key for the chain that no other chain, live or later built, shares."""
+    chain_id = id(chain)
+    entry = _chain_keys.get(chain_id)
+    if entry is not None and entry[0]() is chain:
+        return entry[1]
+    
+    def forget(ref):
+        with _chain_keys_lock:
+            if _chain_keys.get(chain_id, (None,))[0] is ref:
+                del _chain_keys[chain_id]
+    
+    with _chain_keys_lock:
+        entry = _chain_keys.get(chain_id)
+        if entry is None or entry[0]() is not chain:
+            entry = _chain_keys[chain_id] = (weakref.ref(chain, forget), next(_chain_counter))
+    return entry[1]
+
+def invoke_cached(node: str, chain, query: str):
+    """Invoke a classifier/extractor chain, memoizing its output per node, chain and normalized query.
+    
+    The chain is part of the key, so graphs built on different models or tiers
+    do not share each other's outputs, even after an old graph's chains are
+    garbage-collected and their ids reused.
+    """
+    if node_cache is None:
+        return llm_gateway.invoke(chain, {"query": query})
+    return node_cache.get_or_compute(
+        (node, chain_key(chain), normalize_query(query)), lambda: llm_gateway.invoke(chain, {"query": query})
+    )
+
+# Model tier of each chain; AGENT_TIER_<CHAIN> (e.g. AGENT_TIER_ROUTE=large) overrides it
+CHAIN_TIERS = {
+    "route": "small",
+    "check_product": "small",
+    "check_order": "small",
+    "extract_product": "small",
+    "extract_order": "small",
+    "single_product": "large",
+    "multi_product": "large",
+    "order": "large",
+    "orders": "large",
+    "general": "large"
+}
+CHAIN_TIERS.update({
+    name: os.environ[f"AGENT_TIER_{name.upper()}"] for name in CHAIN_TIERS if f"AGENT_TIER_{name.upper()}" in os.environ
+})
+
+# Template of each chain, by chain name
+PROMPTS = {
+    "route": ROUTE_PROMPT,
+    "check_product": CHECK_PRODUCT_PROMPT,
+    "check_order": CHECK_ORDER_PROMPT,
+    "extract_product": EXTRACT_PRODUCT_PROMPT,
+    "extract_order": EXTRACT_ORDER_PROMPT,
+    "single_product": SINGLE_PRODUCT_PROMPT,
+    "multi_product": MULTI_PRODUCT_PROMPT,
+    "order": ORDER_PROMPT,
+    "orders": ORDERS_PROMPT,
+    "general": GENERAL_PROMPT
+}
+
+def compile_chains(model) -> Dict[str, Any]:
+    """Compose every prompt with a chat model, so nodes only invoke prebuilt chains.
+    
+    model is either one chat model for every chain or a dict of models by tier
+    ("small", "large"), in which case each chain uses the model of its CHAIN_TIERS tier.
+    """
+    # Imported on first use to keep langchain_core.prompts out of the import path
+    from langchain_core.prompts import ChatPromptTemplate
+    
+    chains = {}
+    for name, template in PROMPTS.items():
+        chain_model = model[CHAIN_TIERS[name]] if isinstance(model, dict) else model
+        output = chain_model.with_structured_output(RouteDecision) if name == "route" else chain_model
+        chains[name] = ChatPromptTemplate.from_template(template) | output
+    return chains
+
+def get_llm(tier: str = "large"):
+    """Return the shared Groq chat model of a tier, creating it on first use.
+    
+    Tiers configured with the same model name share one client.
+    """
+    model_name = MODEL_TIERS[tier]
+    llm = _llms.get(model_name)
+    if llm is None:
+        with _init_lock:
+            llm = _llms.get(model_name)
+            if llm is None:
+                # langchain_groq is only imported when the real model is needed
+                from langchain_groq import ChatGroq
+                # Retries (429, 5xx, connection errors and timeouts) are left to
+                # llm_gateway, which also honors the rate limits and deadlines
+                llm = _llms[model_name] = ChatGroq(
+                    api_key=os.getenv("GROQ_API_KEY"),
+                    model=model_name,
+                    max_retries=0
+                )
+    return llm
+
+def get_chains() -> Dict[str, Any]:
+    """Return the chains on the shared Groq models, used by nodes that are not bound to other chains."""
+    global _chains
+    if _chains is None:
+        with _init_lock:
+            if _chains is None:
+                _chains = compile_chains({tier: get_llm(tier) for tier in MODEL_TIERS})
+    return _chains
+
+# Per-product prompt text, reused until the product's stock or price changes
+_product_text: Dict[str, Tuple[Tuple, Dict[str, Any]]] = {}
+
+def product_text(product: Dict) -> Dict[str, Any]:
+    """Return the prompt fields and multi-match summary line of a product."""
+    version = (product["stock"], product["price"])
+    cached = _product_text.get(product["id"])
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    availability = "In Stock" if product["stock"] > 0 else "Out of Stock"
+    specs = product["specs"]
+    text = {
+        "fields": {
+            "name": product["name"],
+            "brand": product["brand"],
+            "price": product["price"],
+            "availability": availability,
+            "stock": product["stock"],
+            "description": product["description"],
+            "specs": str(specs)
+        },
+        "line": (
+            f"- {product['name']} ({product['brand']}): ${product['price']}, {availability} ({product['stock']} units), "
+            f"{specs.get('storage', 'n/a')}, {specs.get('screen_size', 'n/a')}\n"
         )
+    }
+    _product_text[product["id"]] = (version, text)
+    return text
+
+def apply_inventory_change(event: ChangeEvent):
+    """Drop the cached responses and prompt text built from a changed product or order."""
+    if response_cache is not None:
+        response_cache.invalidate((event.kind, event.record_id))
+    if event.kind == "product":
+        _product_text.pop(event.record_id, None)
+
+# Stock, price and order status updates go through the feed, which updates the
+# store and then the catalog columns and caches for the changed record only
+inventory = InventoryFeed(store)
+inventory.subscribe(columnar_catalog.apply)
+inventory.subscribe(apply_inventory_change)
+
+def query_with_history(state: AgentState) -> str:
+    """Return the user input, preceded by the conversation so far for follow-up questions."""
+    history = state.get("history")
+    if not history:
+        return state["user_input"]
+    return f"Conversation so far:\n{history}\n\nCurrent message: {state['user_input']}"
+
+def route_query(state: AgentState, chains=None) -> Dict[str, Any]:
+    """Classify the query and extract the product name and order number in one structured LLM call."""
+    chains = chains or get_chains()
+    decision = invoke_cached("route", chains["route"], query_with_history(state))
+    
+    if decision.intent == "product" and decision.product_name:
+        next_node = "retrieve_product"
+    elif decision.intent == "order" and (decision.order_id or decision.customer_name):
+        next_node = "retrieve_order"
+    else:
+        next_node = "generate_response"
+    
+    return {
+        "next": next_node,
+        "product_name": decision.product_name,
+        "order_id": decision.order_id,
+        "customer_name": decision.customer_name
+    }
+
+def extract_product_name(state: AgentState, chains=None) -> str:
+    """Extract the product name or type the query asks about with the LLM."""
+    return invoke_cached("extract_product", (chains or get_chains())["extract_product"], query_with_history(state)).content.strip()
+
+def extract_order_reference(state: AgentState, chains=None) -> str:
+    """Extract the order numbers or "CUSTOMER: <name>" from the query with the LLM, or "NO_ORDER_NUMBER"."""
+    return invoke_cached("extract_order", (chains or get_chains())["extract_order"], query_with_history(state)).content.strip()
+
+def classify(state: AgentState, chains, node: str, verdict: str, extract,
+             likely: bool, speculate: bool) -> Tuple[bool, Optional[str]]:
+    """Run a classifier chain and return whether it answered verdict and, if speculated and needed, the extraction."""
+    speculative = speculator.start(partial(extract, state, chains)) if likely else None
+    try:
+        result = invoke_cached(node, chains[node], query_with_history(state)).content.strip()
+    except Exception:
+        speculator.resolve(speculative, False)
+        raise
+    
+    needed = verdict in result
+    extracted = speculator.resolve(speculative, needed) if speculate else None
+    return needed, extracted
+
+def should_retrieve_product_info(state: AgentState, chains=None, speculate: bool = False) -> Dict[str, str]:
+    """Determine if we need to retrieve product information based on user input."""
+    chains = chains or get_chains()
+    # Using the LLM to decide if this is a product-related query, with the
+    # product name extraction running alongside it in speculative mode
+    likely = speculate and pre_router.likely_product(state["user_input"])
+    needed, product_name = classify(state, chains, "check_product", "RETRIEVE_PRODUCT",
+                                    extract_product_name, likely, speculate)
+    
+    if needed:
+        # retrieve_product reuses the speculative product name
+        return {"next": "retrieve_product", "product_name": product_name} if product_name else {"next": "retrieve_product"}
+    else:
+        return {"next": "next_step"}
+
+def should_retrieve_order_info(state: AgentState, chains=None, speculate: bool = False) -> Dict[str, str]:
+    """Determine if we need to retrieve order information based on user input."""
+    chains = chains or get_chains()
+    # Using the LLM to decide if this is an order-related query, with the
+    # order reference extraction running alongside it in speculative mode
+    likely = speculate and pre_router.likely_order(state["user_input"])
+    needed, extracted = classify(state, chains, "check_order", "RETRIEVE_ORDER",
+                                 extract_order_reference, likely, speculate)
+    
+    if needed:
+        if extracted is None:
+            return {"next": "retrieve_order"}
+        # retrieve_order reuses the speculative order numbers or customer name
+        reference = parse_order_reference(extracted)
+        return {"next": "retrieve_order", **reference} if reference else {"next": "generate_response"}
+    else:
+        return {"next": "generate_response"}
+
+def pre_route_query(state: AgentState) -> Dict[str, Any]:
+    """Answer obvious product and order lookups without an LLM call, or fall back to the LLM nodes."""
+    resolved = pre_router.route(state["user_input"], find_orders)
+    if resolved is None:
+        return {"next": "fallback"}
+    
+    product_info = resolved["product_info"]
+    if product_info:
+        # Serve the store's current records, not the startup snapshot
+        product_info = current_products(product_info, resolved["filters"])
+        if not product_info:
+            # Every attribute match changed since the catalog was built
+            return {"next": "fallback"}
+    
+    return {
+        "next": "generate_response",
+        "product_info": product_info or None,
+        **order_state(resolved["orders"] or [])
+    }
+
+# Retrieval nodes return only the keys they set so they can run in parallel branches
+def retrieve_product_info(state: AgentState, chains=None) -> Dict[str, Any]:
+    """Extract product name from query and retrieve product information."""
+    # Reuse the product name from the routing call when available
+    product_name = state.get("product_name")
+    if product_name:
+        matched_products = find_matching_products(product_name, state["user_input"])
+        return {"product_info": matched_products if matched_products else None}
+    
+    # Using the LLM to extract the product name
+    product_name = extract_product_name(state, chains)
+    
+    # Search for the product in our inventory, falling back to attribute
+    # filters for queries like "phones under $900 with 256GB" and to the
+    # description index for features like "something with a stylus"
+    matched_products = find_matching_products(product_name, state["user_input"])
+    
+    # Update state with product info
+    return {"product_info": matched_products if matched_products else None}
+
+def retrieve_order_info(state: AgentState, chains=None) -> Dict[str, Any]:
+    """Extract the order numbers or customer name from the query and retrieve all matching orders at once."""
+    # Reuse the order numbers or customer name from the routing call when available
+    reference = {key: state[key] for key in ("order_id", "customer_name") if state.get(key)}
+    if not reference:
+        # Using the LLM to extract the order numbers or customer name
+        reference = parse_order_reference(extract_order_reference(state, chains))
+    
+    # One bulk lookup for every order, with product details joined
+    return lookup_orders(reference)
+
+def generate_response(state: AgentState, chains=None, fast: bool = False) -> Dict[str, str]:
+    """Generate a response based on the current state.
+    
+    With fast, purely factual questions about one record are answered from a
+    template and only the rest reach the LLM.
+    """
+    product_info = state.get("product_info")
+    if fast:
+        response = fast_responder.render(state["user_input"], product_info, state.get("order_info"))
+        if response is not None:
+            return {"response": response}
+    
+    chains = chains or get_chains()
+    query = query_with_history(state)
+    
+    if product_info:
+        if len(product_info) == 1:  # Single product match
+            response = llm_gateway.invoke(chains["single_product"], {
+                "query": query,
+                **product_text(product_info[0])["fields"]
+            }).content
+            
+        else:  # Multiple product matches
+            # Only the most relevant matches are listed; the rest are summarized per brand
+            context = build_product_context(
+                product_info, query, lambda product: product_text(product)["line"],
+                top_k=CONTEXT_TOP_K, token_budget=CONTEXT_TOKEN_BUDGET
+            )
+            response = llm_gateway.invoke(chains["multi_product"], {
+                "query": query,
+                "product_info": context
+            }).content
+    
+    elif state.get("order_list"):
+        # Several orders are summarized in one call, at most ORDER_LIMIT of them
+        orders = state["order_list"]
+        lines = [order_line(order) for order in orders[:ORDER_LIMIT]]
+        if len(orders) > ORDER_LIMIT:
+            lines.append(f"- ... and {len(orders) - ORDER_LIMIT} older orders")
+        response = llm_gateway.invoke(chains["orders"], {
+            "query": query,
+            "order_info": "\n".join(lines)
+        }).content
+    
+    elif state.get("order_info"):
+        # Generate response about the order
+        order = state["order_info"]
+        product_details = order.get("product_details", {})
         
-        chain = response_prompt | llm
-        response = chain.invoke({
-            "query": state["user_input"],
+        response = llm_gateway.invoke(chains["order"], {
+            "query": query,
             "order_id": order["order_id"],
             "customer_name": order["customer_name"],
             "product_name": product_details.get("name", "Unknown product"),
@@ -269,48 +807,177 @@ def generate_response(state: AgentState) -> AgentState:
             "quantity": order["quantity"],
             "status": order["status"],
             "order_date": order["order_date"],
-            "shipping_address": order["shipping_address"],
+            "shipping_address": order["shipping_address"] or ADDRESS_WITHHELD,
             "tracking_number": order["tracking_number"] if order["tracking_number"] else "Not available"
         }).content
     
     else:
         # General response for queries that don't match products or orders
-        response_prompt = ChatPromptTemplate.from_template(
-            """You are a helpful customer service agent for a mobile phone retailer.
-            The customer asked: "{query}"
-            
-            We couldn't find specific product or order information related to their query.
-            
-            Provide a helpful general response. If they're asking about products or services we offer,
-            give them general information about our mobile phone retail business.
-            
-            Be polite and professional. Ask clarifying questions if needed.
-            DO NOT make up specific products or prices."""
-        )
-        
-        chain = response_prompt | llm
-        response = chain.invoke({
-            "query": state["user_input"]
-        }).content
+        response = llm_gateway.invoke(chains["general"], {"query": query}).content
     
-    new_state["response"] = response
-    return new_state
+    # Only the response changes; the rest of the state is left to the graph
+    return {"response": response}
+
+def with_chains(node, chains=None, **options):
+    """Bind a node to the given compiled chains, or leave it on the shared Groq model's chains.
+    
+    Extra options (such as speculate) are bound as keyword arguments too.
+    """
+    if chains is not None:
+        options["chains"] = chains
+    return partial(node, **options) if options else node
+
+def add_pre_route(workflow: "StateGraph", fallback: str):
+    """Make the rule-based pre-router the entry point, falling back to the given LLM node."""
+    workflow.add_node("pre_route", pre_route_query)
+    workflow.set_entry_point("pre_route")
+    workflow.add_conditional_edges(
+        "pre_route",
+        lambda x: x.get("next", "fallback"),
+        {
+            "generate_response": "generate_response",
+            "fallback": fallback
+        }
+    )
+
+def build_routed_graph(pre_route: bool = PRE_ROUTE, llm=None, fast_responses: bool = FAST_RESPONSES):
+    """Build the graph that routes with a single structured-output LLM call."""
+    from langgraph.graph import END, StateGraph
+    
+    # Compile the chains once per graph rather than once per node call
+    chains = compile_chains(llm) if llm is not None else None
+    workflow = StateGraph(AgentState)
+    
+    workflow.add_node("route", with_chains(route_query, chains))
+    workflow.add_node("retrieve_product", with_chains(retrieve_product_info, chains))
+    workflow.add_node("retrieve_order", with_chains(retrieve_order_info, chains))
+    workflow.add_node("generate_response", with_chains(generate_response, chains, fast=fast_responses))
+    
+    if pre_route:
+        add_pre_route(workflow, "route")
+    else:
+        workflow.set_entry_point("route")
+    
+    workflow.add_conditional_edges(
+        "route",
+        lambda x: x.get("next", "generate_response"),
+        {
+            "retrieve_product": "retrieve_product",
+            "retrieve_order": "retrieve_order",
+            "generate_response": "generate_response"
+        }
+    )
+    
+    # Queries mentioning both a product and an order number fetch both
+    workflow.add_conditional_edges(
+        "retrieve_product",
+        lambda x: "retrieve_order" if x.get("order_id") or x.get("customer_name") else "generate_response",
+        {
+            "retrieve_order": "retrieve_order",
+            "generate_response": "generate_response"
+        }
+    )
+    
+    workflow.add_edge("retrieve_order", "generate_response")
+    workflow.add_edge("generate_response", END)
+    
+    return workflow.compile()
+
+def build_parallel_graph(pre_route: bool = PRE_ROUTE, llm=None, speculate: bool = SPECULATE,
+                         fast_responses: bool = FAST_RESPONSES):
+    """Build the graph that runs the product and order branches concurrently.
+    
+    Both classifiers start at once and each branch ends in a pass-through node;
+    generate_response waits for both, so wall time is the slower branch only.
+    """
+    from langgraph.graph import END, StateGraph
+    
+    # Compile the chains once per graph rather than once per node call
+    chains = compile_chains(llm) if llm is not None else None
+    workflow = StateGraph(AgentState)
+    
+    workflow.add_node("fan_out", lambda x: {})  # Pass-through node
+    workflow.add_node("check_product", with_chains(should_retrieve_product_info, chains, speculate=speculate))
+    workflow.add_node("retrieve_product", with_chains(retrieve_product_info, chains))
+    workflow.add_node("product_done", lambda x: {})
+    workflow.add_node("check_order", with_chains(should_retrieve_order_info, chains, speculate=speculate))
+    workflow.add_node("retrieve_order", with_chains(retrieve_order_info, chains))
+    workflow.add_node("order_done", lambda x: {})
+    workflow.add_node("generate_response", with_chains(generate_response, chains, fast=fast_responses))
+    
+    if pre_route:
+        add_pre_route(workflow, "fan_out")
+    else:
+        workflow.set_entry_point("fan_out")
+    
+    workflow.add_edge("fan_out", "check_product")
+    workflow.add_edge("fan_out", "check_order")
+    
+    workflow.add_conditional_edges(
+        "check_product",
+        lambda x: "retrieve_product" if x.get("next") == "retrieve_product" else "product_done",
+        {
+            "retrieve_product": "retrieve_product",
+            "product_done": "product_done"
+        }
+    )
+    workflow.add_edge("retrieve_product", "product_done")
+    
+    workflow.add_conditional_edges(
+        "check_order",
+        lambda x: "retrieve_order" if x.get("next") == "retrieve_order" else "order_done",
+        {
+            "retrieve_order": "retrieve_order",
+            "order_done": "order_done"
+        }
+    )
+    workflow.add_edge("retrieve_order", "order_done")
+    
+    # Join: run generate_response once both branches have finished
+    workflow.add_edge(["product_done", "order_done"], "generate_response")
+    workflow.add_edge("generate_response", END)
+    
+    return workflow.compile()
 
 # Create and define the graph
-def build_graph():
+def build_graph(routing: str = "chained", pre_route: bool = PRE_ROUTE, llm=None, speculate: bool = SPECULATE,
+                fast_responses: bool = FAST_RESPONSES):
+    """Build the agent graph for the given routing mode ("chained", "structured" or "parallel").
+    
+    Pass llm to run the graph on a different chat model, e.g. a local fake for
+    benchmarks, or a dict of models by tier ({"small": ..., "large": ...}).
+    With speculate, the chained and parallel classifiers overlap the likely
+    extraction call; the structured router already extracts in its one call.
+    With fast_responses, factual single-record answers skip the LLM generation.
+    """
+    if routing == "structured":
+        return build_routed_graph(pre_route, llm, fast_responses)
+    if routing == "parallel":
+        return build_parallel_graph(pre_route, llm, speculate, fast_responses)
+    if routing != "chained":
+        raise ValueError(f"Unknown routing mode: {routing}")
+    
+    from langgraph.graph import END, StateGraph
+    
+    # Compile the chains once per graph rather than once per node call
+    chains = compile_chains(llm) if llm is not None else None
+    
     # Define state graph
     workflow = StateGraph(AgentState)
     
     # Add nodes
-    workflow.add_node("check_product", should_retrieve_product_info)
-    workflow.add_node("retrieve_product", retrieve_product_info)
-    workflow.add_node("check_order", should_retrieve_order_info)
-    workflow.add_node("retrieve_order", retrieve_order_info)
-    workflow.add_node("generate_response", generate_response)
-    workflow.add_node("next_step", lambda x: x)  # Pass-through node
+    workflow.add_node("check_product", with_chains(should_retrieve_product_info, chains, speculate=speculate))
+    workflow.add_node("retrieve_product", with_chains(retrieve_product_info, chains))
+    workflow.add_node("check_order", with_chains(should_retrieve_order_info, chains, speculate=speculate))
+    workflow.add_node("retrieve_order", with_chains(retrieve_order_info, chains))
+    workflow.add_node("generate_response", with_chains(generate_response, chains, fast=fast_responses))
+    workflow.add_node("next_step", lambda x: {})  # Pass-through node
     
     # Set the entry point
-    workflow.set_entry_point("check_product")
+    if pre_route:
+        add_pre_route(workflow, "check_product")
+    else:
+        workflow.set_entry_point("check_product")
     
     # Add edges using conditional_edges for router nodes
     workflow.add_conditional_edges(
@@ -339,23 +1006,336 @@ def build_graph():
     
     return workflow.compile()
 
-# Build the graph
-customer_support_agent = build_graph()
+def get_agent():
+    """Return the graph for AGENT_ROUTING_MODE, building it on first use.
+    
+    The graph is shared by every thread and session; concurrent first calls
+    build it only once.
+    """
+    global _agent
+    if _agent is None:
+        with _init_lock:
+            if _agent is None:
+                _agent = build_graph(ROUTING_MODE)
+    return _agent
+
+def __getattr__(name: str):
+    # The former module-level llm and customer_support_agent, now created lazily
+    if name == "llm":
+        return get_llm()
+    if name == "customer_support_agent":
+        return get_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def initial_state(user_input: str, history: Optional[str] = None) -> AgentState:
+    """Return the graph input state for a user query and the conversation so far."""
+    return {
+        "user_input": user_input,
+        "product_info": None,
+        "order_info": None,
+        "order_list": None,
+        "response": None,
+        "product_name": None,
+        "order_id": None,
+        "customer_name": None,
+        "history": history or None
+    }
 
-def process_query(user_input: str) -> str:
-    """Process a user query and return the agent's response."""
-    # Initialize state with user input
-    initial_state = {"user_input": user_input, "product_info": None, "order_info": None, "response": None}
+def run_config(callbacks: Optional[List], trace: Optional[RequestTrace]) -> Dict[str, Any]:
+    """Return the graph run config, attaching the request trace when tracing is enabled."""
+    callbacks = list(callbacks or [])
+    if trace is not None:
+        callbacks.append(trace)
+    return {"callbacks": callbacks}
+
+def is_overload_error(error: BaseException) -> bool:
+    """Check whether an error means the LLM is overloaded, unreachable or too slow, rather than a bug."""
+    return isinstance(error, (DeadlineExceeded, Overloaded)) or is_retryable(error)
+
+def degraded_response(user_input: str) -> str:
+    """Answer without any LLM call: deterministic matching and the matched records' facts only."""
+    resolved = pre_router.route(user_input, find_orders)
+    if resolved is not None:
+        product_info, orders = current_products(resolved["product_info"] or [], resolved["filters"]), resolved["orders"]
+    else:
+        # Same fallbacks as retrieve_product_info: no feature matches for an unstocked model
+        product_info, orders = find_matching_products(user_input, user_input), None
+    return render_data_only(product_info, orders)
+
+def run_admitted(user_input: str, run: Callable[[], AgentState],
+                 degrade: bool = True) -> Tuple[str, Optional[AgentState]]:
+    """Run the graph under admission control, falling back to a data-only answer.
+    
+    The data-only answer is served when the request is shed, when the latency
+    or error budget is exceeded, or when the graph runs out of time or hits an
+    overloaded LLM. With degrade=False these raise instead (Overloaded, or the
+    LLM's error). Returns the response and the graph's final state (None for
+    data-only answers, which are not cached).
+    """
+    if admission is None:
+        result = run()
+        return result["response"], result
     
-    # Run the graph
-    result = customer_support_agent.invoke(initial_state)
+    try:
+        with admission.admit():
+            if not admission.should_degrade():
+                start = time.monotonic()
+                try:
+                    result = run()
+                except Exception as e:
+                    if not is_overload_error(e):
+                        raise
+                    admission.record(time.monotonic() - start, failed=True)
+                    if not degrade:
+                        raise
+                else:
+                    admission.record(time.monotonic() - start)
+                    return result["response"], result
+            elif not degrade:
+                raise Overloaded("Latency or error budget exceeded")
+    except Overloaded:
+        if not degrade:
+            raise
+    
+    admission.record_degraded()
+    return degraded_response(user_input), None
+
+async def arun_admitted(user_input: str, run, degrade: bool = True) -> Tuple[str, Optional[AgentState]]:
+    """Async variant of run_admitted; run is a coroutine function."""
+    if admission is None:
+        result = await run()
+        return result["response"], result
+    
+    try:
+        async with admission.aadmit():
+            if not admission.should_degrade():
+                start = time.monotonic()
+                try:
+                    result = await run()
+                except Exception as e:
+                    if not is_overload_error(e):
+                        raise
+                    admission.record(time.monotonic() - start, failed=True)
+                    if not degrade:
+                        raise
+                else:
+                    admission.record(time.monotonic() - start)
+                    return result["response"], result
+            elif not degrade:
+                raise Overloaded("Latency or error budget exceeded")
+    except Overloaded:
+        if not degrade:
+            raise
+    
+    admission.record_degraded()
+    return degraded_response(user_input), None
+
+def process_query(user_input: str, graph=None, callbacks: Optional[List] = None,
+                  memory: Optional[ConversationMemory] = None, degrade: bool = True) -> str:
+    """Process a user query and return the agent's response.
+    
+    With a memory, the query is answered in the context of the conversation so
+    far and the exchange is added to it. With degrade=False, an overloaded
+    request raises Overloaded (or the LLM's error) instead of returning a
+    data-only answer.
+    """
+    graph = graph or get_agent()
+    trace = tracer.start(user_input)
+    history = memory.render() if memory is not None else ""
+    
+    # Repeated questions are answered from the cache while their records are unchanged
+    cache_key = normalize_query(f"{history}\n{user_input}")
+    response = response_cache.get(cache_key) if response_cache is not None else None
+    if response is not None:
+        tracer.finish(trace, cached=True)
+    else:
+        # Run the graph, or answer from the data alone when overloaded
+        response, result = run_admitted(
+            user_input, lambda: graph.invoke(initial_state(user_input, history), config=run_config(callbacks, trace)),
+            degrade
+        )
+        if response_cache is not None and result is not None:
+            response_cache.put(cache_key, response, deps=record_versions(result))
+        tracer.finish(trace)
+    
+    if memory is not None:
+        memory.add(user_input, response)
     
     # Return the response
-    return result["response"]
+    return response
+
+async def aprocess_query(user_input: str, graph=None, callbacks: Optional[List] = None,
+                         memory: Optional[ConversationMemory] = None, degrade: bool = True) -> str:
+    """Async variant of process_query for use from event loops."""
+    graph = graph or get_agent()
+    trace = tracer.start(user_input)
+    history = memory.render() if memory is not None else ""
+    
+    cache_key = normalize_query(f"{history}\n{user_input}")
+    response = response_cache.get(cache_key) if response_cache is not None else None
+    if response is not None:
+        tracer.finish(trace, cached=True)
+    else:
+        response, result = await arun_admitted(
+            user_input, lambda: graph.ainvoke(initial_state(user_input, history), config=run_config(callbacks, trace)),
+            degrade
+        )
+        if response_cache is not None and result is not None:
+            response_cache.put(cache_key, response, deps=record_versions(result))
+        tracer.finish(trace)
+    
+    if memory is not None:
+        memory.add(user_input, response)
+    
+    return response
+
+def stream_query(user_input: str, graph=None, callbacks: Optional[List] = None,
+                 memory: Optional[ConversationMemory] = None) -> Iterator[str]:
+    """Process a user query and yield the agent's response in chunks as they are generated."""
+    graph = graph or get_agent()
+    trace = tracer.start(user_input)
+    history = memory.render() if memory is not None else ""
+    
+    cache_key = normalize_query(f"{history}\n{user_input}")
+    if response_cache is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            tracer.finish(trace, cached=True)
+            if memory is not None:
+                memory.add(user_input, cached)
+            yield cached
+            return
+    
+    # "messages" carries the LLM tokens, "values" the final state for the cache
+    result = None
+    streamed = False
+    try:
+        with admission.admit() if admission is not None else nullcontext():
+            if admission is None or not admission.should_degrade():
+                start = time.monotonic()
+                # Once answer tokens are out, the gateway no longer retries a failed call
+                with streaming() as answered:
+                    try:
+                        for mode, data in graph.stream(
+                            initial_state(user_input, history),
+                            config=run_config(list(callbacks or []) + [AnswerWatcher(answered)], trace),
+                            stream_mode=["messages", "values"]
+                        ):
+                            if mode == "values":
+                                result = data
+                                continue
+                            chunk, metadata = data
+                            # Only the final answer is streamed, not classifier or extractor output
+                            if metadata.get("langgraph_node") == "generate_response" and chunk.content:
+                                streamed = True
+                                yield chunk.content
+                    except Exception as e:
+                        # A partly streamed answer cannot be replaced by a data-only one
+                        if admission is None or streamed or answered.is_set() or not is_overload_error(e):
+                            raise
+                        admission.record(time.monotonic() - start, failed=True)
+                        result = None
+                    else:
+                        if admission is not None:
+                            admission.record(time.monotonic() - start)
+    except Overloaded:
+        pass
+    
+    if result is None:
+        # Shed, over budget or out of time: answer from the data alone, uncached
+        if admission is not None:
+            admission.record_degraded()
+        response = degraded_response(user_input)
+        yield response
+        if memory is not None:
+            memory.add(user_input, response)
+        tracer.finish(trace)
+        return
+    
+    # A response coalesced with an identical in-flight call arrives without tokens
+    if not streamed:
+        yield result["response"]
+    
+    if response_cache is not None:
+        response_cache.put(cache_key, result["response"], deps=record_versions(result))
+    if memory is not None:
+        memory.add(user_input, result["response"])
+    tracer.finish(trace)
+
+def unique_queries(queries: List[str]) -> Tuple[List[str], List[int]]:
+    """Return the distinct queries of a batch and, per input, the index of its distinct query."""
+    positions: Dict[str, int] = {}
+    distinct = []
+    slots = []
+    for query in queries:
+        key = normalize_query(query)
+        if key not in positions:
+            positions[key] = len(distinct)
+            distinct.append(query)
+        slots.append(positions[key])
+    return distinct, slots
+
+def batch_concurrency(max_concurrency: int) -> int:
+    """Cap a batch's concurrency at what admission control can run or queue, so the batch itself is not shed."""
+    if admission is not None:
+        max_concurrency = min(max_concurrency, admission.max_concurrent + admission.max_queue)
+    return max(1, max_concurrency)
+
+def process_queries(queries: List[str], max_concurrency: int = BATCH_CONCURRENCY,
+                    graph=None, callbacks: Optional[List] = None) -> List[Union[str, Exception]]:
+    """Process a batch of queries concurrently and return the responses in input order.
+    
+    Repeated queries in the batch run the graph once. A query that fails yields
+    its exception in place of a response instead of aborting the batch; this
+    includes Overloaded when admission control sheds it, since a data-only
+    answer could not be told apart from a real one.
+    """
+    distinct, slots = unique_queries(queries)
+    
+    def run(query: str) -> Union[str, Exception]:
+        try:
+            return process_query(query, graph=graph, callbacks=callbacks, degrade=False)
+        except Exception as e:
+            return e
+    
+    with ThreadPoolExecutor(max_workers=batch_concurrency(max_concurrency)) as executor:
+        results = list(executor.map(run, distinct))
+    return [results[slot] for slot in slots]
+
+async def aprocess_queries(queries: List[str], max_concurrency: int = BATCH_CONCURRENCY,
+                           graph=None, callbacks: Optional[List] = None) -> List[Union[str, Exception]]:
+    """Async variant of process_queries."""
+    distinct, slots = unique_queries(queries)
+    semaphore = asyncio.Semaphore(batch_concurrency(max_concurrency))
+    
+    async def run(query: str) -> str:
+        async with semaphore:
+            return await aprocess_query(query, graph=graph, callbacks=callbacks, degrade=False)
+    
+    results = await asyncio.gather(*(run(query) for query in distinct), return_exceptions=True)
+    return [results[slot] for slot in slots]
+
+def compare_routing_modes(queries: List[str]) -> Dict[str, Dict[str, float]]:
+    """Run the queries through each routing mode and report LLM calls and latency per query."""
+    results = {}
+    for routing in ("chained", "structured", "parallel"):
+        graph = build_graph(routing)
+        counter = LLMCallCounter()
+        # Start each mode cold so cached answers don't hide its LLM calls
+        clear_caches()
+        start = time.perf_counter()
+        for query in queries:
+            process_query(query, graph=graph, callbacks=[counter])
+        elapsed = time.perf_counter() - start
+        results[routing] = {
+            "llm_calls_per_query": counter.calls / len(queries),
+            "latency_per_query_s": elapsed / len(queries)
+        }
+    return results
 
 if __name__ == "__main__":
     # Test the agent
     test_query = "Do you have the iPhone 15 Pro in stock?"
     response = process_query(test_query)
     print(f"Query: {test_query}")
-    print(f"Response: {response}") 
\ No newline at end of file
+    print(f"Response: {response}")
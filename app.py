@@ -1,5 +1,6 @@
 import streamlit as st
-from agent import process_query
+from agent import get_agent, get_chains, stream_query
+from memory import ConversationMemory
 
 # Set page config with dark theme
 st.set_page_config(
@@ -114,10 +115,42 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def load_agent():
+    """Build the agent graph and Groq client once per server process, shared by every session and rerun."""
+    get_chains()
+    return get_agent()
+
+def message_html(role, content):
+    """Render a chat message as HTML."""
+    avatar = "👤" if role == "user" else "🤖"
+    return f"""
+    <div class="chat-message {role}">
+        <div class="avatar">
+            {avatar}
+        </div>
+        <div class="content">
+            {content}
+        </div>
+    </div>
+    """
+
+# Messages shown per page of chat history, and the most kept per session
+PAGE_SIZE = 20
+MAX_MESSAGES = 500
+
 # Initialize session state variables
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Bounded memory the agent uses to answer follow-up questions
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+
+# Number of recent messages rendered; "Show earlier messages" adds a page
+if "visible_messages" not in st.session_state:
+    st.session_state.visible_messages = PAGE_SIZE
+
 # Initialize query state for sample queries
 if "query_to_use" not in st.session_state:
     st.session_state.query_to_use = None
@@ -133,21 +166,15 @@ st.markdown('</div>', unsafe_allow_html=True)
 # Chat container
 st.markdown('<div class="chat-container">', unsafe_allow_html=True)
 
-# Display chat messages
+# Display the most recent chat messages; earlier ones are paged in on request
 if st.session_state.messages:
-    for message in st.session_state.messages:
+    hidden = len(st.session_state.messages) - st.session_state.visible_messages
+    if hidden > 0 and st.button(f"Show earlier messages ({hidden} hidden)", key="show_earlier"):
+        st.session_state.visible_messages += PAGE_SIZE
+        st.rerun()
+    for message in st.session_state.messages[-st.session_state.visible_messages:]:
         with st.container():
-            avatar = "👤" if message["role"] == "user" else "🤖"
-            st.markdown(f"""
-            <div class="chat-message {message['role']}">
-                <div class="avatar">
-                    {avatar}
-                </div>
-                <div class="content">
-                    {message['content']}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(message_html(message["role"], message["content"]), unsafe_allow_html=True)
 else:
     st.info("👋 Hello! How can I help you today? Ask me about our mobile phones or your orders.")
 
@@ -175,14 +202,21 @@ st.markdown('</div>', unsafe_allow_html=True)
 if send_button and user_input:
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": user_input})
+    st.markdown(message_html("user", user_input), unsafe_allow_html=True)
     
-    # Display "thinking" message
+    # Render the answer as it streams in; the spinner only covers time to first token
+    placeholder = st.empty()
     with st.spinner("AI Assistant is thinking..."):
-        # Process query through our agent
-        response = process_query(user_input)
+        chunks = stream_query(user_input, graph=load_agent(), memory=st.session_state.memory)
+        response = next(chunks, "")
+    for chunk in chunks:
+        placeholder.markdown(message_html("bot", response + "▌"), unsafe_allow_html=True)
+        response += chunk
+    placeholder.markdown(message_html("bot", response), unsafe_allow_html=True)
     
-    # Add agent response to chat history
+    # Add agent response to chat history, dropping the oldest messages past the cap
     st.session_state.messages.append({"role": "bot", "content": response})
+    del st.session_state.messages[:-MAX_MESSAGES]
     
     # Rerun to update the UI
     st.rerun()
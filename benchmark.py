@@ -0,0 +1,842 @@
+"""Offline performance benchmarks for the support agent's data paths.
+
+Run with: python benchmark.py [name ...]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from catalog import ColumnarCatalog, parse_storage_gb
+from cache import ResponseCache
+from bm25 import BM25Index
+from context import build_product_context, estimate_tokens
+from inventory import InventoryFeed
+from memory import ConversationMemory
+from order_store import OrderRepository
+from search import ATTRIBUTE_PATTERN, ProductIndex
+from storage import SQLiteStore
+from tracing import PrometheusExporter, Tracer
+
+BRANDS = {
+    "Apple": ["iPhone"],
+    "Samsung": ["Galaxy S", "Galaxy A", "Galaxy Z Fold", "Galaxy Z Flip"],
+    "Google": ["Pixel"],
+    "Xiaomi": ["Redmi Note", "Poco F", "Mi"],
+    "OnePlus": ["Nord", "OnePlus"],
+    "Motorola": ["Moto G", "Edge"],
+    "Sony": ["Xperia"],
+    "Nokia": ["G", "X"],
+}
+VARIANTS = ["", "Pro", "Pro Max", "Ultra", "Plus", "Lite", "Mini", "FE"]
+COLORS = ["Black", "White", "Blue", "Green", "Red", "Silver", "Gold"]
+STORAGE = ["64GB", "128GB", "256GB", "512GB", "1TB"]
+STATUSES = ["Processing", "Shipped", "Delivered", "Cancelled"]
+FEATURES = ["200MP camera", "S Pen stylus", "fast charging", "Leica optics", "AI features", "titanium design",
+            "Snapdragon chip", "long battery life", "water resistance", "wireless charging", "periscope zoom"]
+
+
+def synthetic_products(n: int, seed: int = 0) -> List[Dict]:
+    """Generate a catalog of n products shaped like data.products."""
+    rng = random.Random(seed)
+    brands = list(BRANDS)
+    catalog = []
+    for i in range(n):
+        brand = brands[i % len(brands)]
+        series = rng.choice(BRANDS[brand])
+        variant = rng.choice(VARIANTS)
+        name = f"{series} {rng.randint(1, 99)} {variant}".strip()
+        # Mirror data.py: "iPhone 15 Pro" but "Samsung Galaxy S24 Ultra"
+        if brand != "Apple" and not name.startswith(brand):
+            name = f"{brand} {name}"
+        catalog.append({
+            "id": f"P{i:06d}",
+            "name": f"{name} {rng.choice(STORAGE)}",
+            "brand": brand,
+            "price": round(rng.uniform(99, 1999), 2),
+            "stock": rng.randint(0, 50),
+            # Features vary with the index only, so the random draws stay the same
+            "description": f"{brand} {series} phone with {FEATURES[i % len(FEATURES)]} and {FEATURES[i * 7 % len(FEATURES)]}",
+            "specs": {
+                "screen_size": f"{rng.uniform(5.4, 7.6):.2f} inches",
+                "storage": rng.choice(STORAGE),
+                "colors": rng.sample(COLORS, 2)
+            }
+        })
+    return catalog
+
+
+def synthetic_orders(n: int, catalog: List[Dict], seed: int = 0) -> List[Dict]:
+    """Generate n orders shaped like data.orders against the given catalog."""
+    rng = random.Random(seed)
+    return [
+        {
+            "order_id": f"ORD{10001 + i}",
+            "customer_name": f"Customer {rng.randint(1, n // 4 + 1)}",
+            "product_id": rng.choice(catalog)["id"],
+            "quantity": rng.randint(1, 3),
+            "status": rng.choice(STATUSES),
+            "shipping_address": f"{rng.randint(1, 999)} Main St",
+            "tracking_number": f"TRK{rng.randint(10**7, 10**8 - 1)}{i}",
+            "order_date": "2023-04-15"
+        }
+        for i in range(n)
+    ]
+
+
+def linear_search(catalog: List[Dict], product_name: str) -> List[Dict]:
+    """The original retrieve_product_info substring scan."""
+    matched_products = []
+    for product in catalog:
+        if (product_name.lower() in product["name"].lower() or
+                product_name.lower() in product["brand"].lower()):
+            matched_products.append(product)
+    return matched_products
+
+
+def linear_order_lookup(catalog: List[Dict], order_list: List[Dict], order_number: str):
+    """The original retrieve_order_info scan and per-request join."""
+    matched_order = None
+    for order in order_list:
+        if order["order_id"] == order_number:
+            matched_order = order.copy()
+            for product in catalog:
+                if product["id"] == order["product_id"]:
+                    matched_order["product_details"] = product
+                    break
+            break
+    return matched_order
+
+
+def time_per_call(fn: Callable, queries: List[str], repeat: int) -> float:
+    """Return the mean wall time per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1e6
+
+
+def bench_search(n: int = 100_000, limit: int = 10, agent_limit: int = 50):
+    """Compare the product index against the linear scan on a synthetic catalog.
+
+    Broad queries ("samsung") match a large share of the catalog, so they are
+    also timed at the agent's search cap (AGENT_SEARCH_LIMIT) and without a limit.
+    """
+    catalog = synthetic_products(n)
+    queries = ["Pixel 42 Pro", "galaxy ultra", "pixel8", "samsng galaxy s 17", "xperia 5 mini", "iPhone 15 Pro Max"]
+    broad = ["samsung", "pixel", "galaxy"]
+
+    start = time.perf_counter()
+    index = ProductIndex(catalog)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    index_us = time_per_call(lambda q: index.search(q, limit=limit), queries, repeat=200)
+    linear_us = time_per_call(lambda q: linear_search(catalog, q), queries, repeat=3)
+    capped_us = time_per_call(lambda q: index.search(q, limit=agent_limit), broad, repeat=200)
+    unlimited_us = time_per_call(lambda q: index.search(q), broad, repeat=20)
+    matches = statistics.mean(len(index.search(q)) for q in broad)
+
+    print(f"catalog size:       {n}")
+    print(f"index build:        {build_ms:.1f} ms")
+    print(f"index search:       {index_us:.1f} us/query (top {limit})")
+    print(f"linear scan:        {linear_us:.1f} us/query")
+    print(f"speedup:            {linear_us / index_us:.0f}x")
+    print(f"broad queries:      {matches:.0f} matches/query")
+    print(f"  agent cap:        {capped_us:.1f} us/query (top {agent_limit})")
+    print(f"  unlimited:        {unlimited_us:.1f} us/query")
+
+    from data import products
+    stocked = ProductIndex(products)
+    unstocked = [query for query in UNSTOCKED_QUERIES if stocked.search(ATTRIBUTE_PATTERN.sub(" ", query)) == []]
+    print(f"unstocked models:   {len(unstocked)}/{len(UNSTOCKED_QUERIES)} reported as not found")
+
+
+def bench_orders(n: int = 1_000_000, catalog_size: int = 10_000):
+    """Compare the order repository against the linear scan and per-request join."""
+    catalog = synthetic_products(catalog_size)
+    order_list = synthetic_orders(n, catalog)
+    rng = random.Random(1)
+    queries = [f"ORD{10001 + rng.randrange(n)}" for _ in range(50)]
+
+    start = time.perf_counter()
+    repository = OrderRepository(order_list, catalog)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    repository_us = time_per_call(repository.get, queries, repeat=1000)
+    linear_us = time_per_call(lambda q: linear_order_lookup(catalog, order_list, q), queries[:5], repeat=1)
+
+    print(f"orders:             {n}")
+    print(f"repository build:   {build_ms:.1f} ms")
+    print(f"repository lookup:  {repository_us:.2f} us/query")
+    print(f"linear scan:        {linear_us:.1f} us/query")
+    print(f"speedup:            {linear_us / repository_us:.0f}x")
+
+
+def bench_sqlite(n: int = 1_000_000, catalog_size: int = 10_000):
+    """Time indexed SQLite order and product lookups with n orders on disk."""
+    catalog = synthetic_products(catalog_size)
+    order_list = synthetic_orders(n, catalog)
+    rng = random.Random(1)
+    queries = [f"ORD{10001 + rng.randrange(n)}" for _ in range(200)]
+    customers = [order_list[rng.randrange(n)]["customer_name"] for _ in range(50)]
+    product_ids = [[product["id"] for product in rng.sample(catalog, 10)] for _ in range(50)]
+    order_batches = [[f"ORD{10001 + rng.randrange(n)}" for _ in range(10)] for _ in range(50)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        store.load(catalog, order_list)
+        load_s = time.perf_counter() - start
+
+        order_us = time_per_call(store.get, queries, repeat=20)
+        customer_us = time_per_call(store.find_by_customer, customers, repeat=20)
+        products_us = time_per_call(store.get_products, product_ids, repeat=20)
+        bulk_us = time_per_call(store.get_many, order_batches, repeat=20)
+        one_by_one_us = time_per_call(lambda batch: [store.get(order_id) for order_id in batch], order_batches, repeat=20)
+        store.close()
+
+    print(f"orders:             {n}")
+    print(f"load:               {load_s:.1f} s")
+    print(f"order by id:        {order_us:.1f} us/query (product joined)")
+    print(f"orders by customer: {customer_us:.1f} us/query")
+    print(f"10 products by id:  {products_us:.1f} us/query")
+    print(f"10 orders by id:    {bulk_us:.1f} us/query bulk, {one_by_one_us:.1f} us one by one")
+
+
+def loop_filter(catalog: List[Dict], max_price: float, min_storage_gb: int) -> List[Dict]:
+    """Row-at-a-time baseline for the columnar filter."""
+    matches = [p for p in catalog
+               if p["price"] <= max_price and parse_storage_gb(p["specs"]["storage"]) >= min_storage_gb]
+    return sorted(matches, key=lambda p: p["price"])[:10]
+
+
+def bench_catalog(n: int = 1_000_000):
+    """Compare vectorized attribute filters against a Python loop over the catalog."""
+    catalog = synthetic_products(n)
+    start = time.perf_counter()
+    columnar = ColumnarCatalog(catalog)
+    build_s = time.perf_counter() - start
+
+    queries = ["phones under $900 with 256GB", "Samsung between $500 and $800 in stock",
+               "at least 6.7 inch screen under 1.2k", "black phone with 512GB below $700"]
+    filter_us = time_per_call(lambda q: columnar.filter(columnar.parse_filters(q), limit=10), queries, repeat=5)
+    loop_us = time_per_call(lambda q: loop_filter(catalog, 900, 256), queries[:1], repeat=1)
+
+    print(f"catalog size:       {n}")
+    print(f"columnar build:     {build_s:.1f} s")
+    print(f"vectorized filter:  {filter_us / 1e3:.2f} ms/query (parse + mask + top 10)")
+    print(f"python loop:        {loop_us / 1e3:.2f} ms/query")
+    print(f"speedup:            {loop_us / filter_us:.0f}x")
+
+
+def bench_context(n: int = 10_000, top_k: int = 5, token_budget: int = 400):
+    """Compare the multi-match prompt context with and without the top-k/token budget."""
+    import agent
+
+    catalog = synthetic_products(n)
+    index = ProductIndex(catalog)
+    queries = ["Samsung", "Galaxy Ultra", "Pixel Pro", "Xperia"]
+
+    def line(product):
+        return agent.product_text(product)["line"]
+
+    print(f"catalog size:       {n}")
+    for query in queries:
+        matches = index.search(query)
+        full = estimate_tokens("".join(line(product) for product in matches))
+        budgeted = estimate_tokens(build_product_context(matches, query, line, top_k, token_budget))
+        build_us = time_per_call(lambda q: build_product_context(matches, q, line, top_k, token_budget), [query], repeat=20)
+        print(f"{query!r:20} {len(matches):5} matches: {full:7} -> {budgeted:4} tokens, built in {build_us / 1e3:.2f} ms")
+
+
+def bench_memory(turns: int = 500):
+    """Show that the conversation history sent to the LLM stays bounded as a session grows."""
+    memory = ConversationMemory()
+    answer = "Yes, the iPhone 15 Pro is in stock at $999.99. It comes in Black, White, Blue and Natural. " * 3
+    for turn in range(1, turns + 1):
+        memory.add(f"Question {turn}: is the iPhone 15 Pro available in blue?", answer)
+        if turn in (1, 10, 100, turns):
+            history = memory.render()
+            render_us = time_per_call(lambda _: memory.render(), [""], repeat=100)
+            print(f"after {turn:4} turns: {estimate_tokens(history):4} history tokens, rendered in {render_us:.1f} us")
+
+
+def bench_updates(n_products: int = 100_000, n_orders: int = 300_000, updates: int = 30_000):
+    """Compare incremental updates through the inventory feed against rebuilding the derived structures."""
+    catalog = synthetic_products(n_products)
+    orders = synthetic_orders(n_orders, catalog)
+
+    start = time.perf_counter()
+    repository = OrderRepository(orders, catalog)
+    columnar = ColumnarCatalog(catalog)
+    rebuild_s = time.perf_counter() - start
+
+    cache = ResponseCache(maxsize=10_000, ttl=None, dep_key=lambda dep: dep[:2])
+    for product in catalog[:10_000]:
+        cache.put(product["id"], "answer", deps=[("product", product["id"])])
+
+    feed = InventoryFeed(repository)
+    feed.subscribe(columnar.apply)
+    feed.subscribe(lambda event: cache.invalidate((event.kind, event.record_id)))
+
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for i in range(updates):
+        product = rng.choice(catalog)
+        if i % 3 == 0:
+            feed.update_stock(product["id"], rng.randint(0, 50))
+        elif i % 3 == 1:
+            feed.update_price(product["id"], round(rng.uniform(99, 1999), 2))
+        else:
+            order = rng.choice(orders)
+            feed.update_order_status(order["order_id"], rng.choice(STATUSES))
+    update_us = (time.perf_counter() - start) / updates * 1e6
+
+    # The derived structures agree with the records after the updates
+    row = columnar.rows[product["id"]]
+    assert columnar.price[row] == product["price"] and columnar.stock[row] == product["stock"]
+    status = repository.get(order["order_id"])["status"]
+    assert order["order_id"].upper() in repository.by_status[status.lower()]
+
+    print(f"catalog / orders:   {n_products} / {n_orders}")
+    print(f"rebuild:            {rebuild_s * 1e3:.0f} ms (repository + columnar catalog)")
+    print(f"feed update:        {update_us:.1f} us/update ({feed.sequence} events, "
+          f"{cache.stats()['invalidations']} cached answers invalidated)")
+    print(f"speedup:            {rebuild_s * 1e6 / update_us:.0f}x")
+
+
+def loop_bm25(catalog: List[Dict], query: str, limit: int = 5) -> List[Dict]:
+    """Score every product for the query in pure Python, as a baseline for BM25Index."""
+    from bm25 import product_text, terms
+    query_terms = set(terms(query))
+    scored = []
+    for product in catalog:
+        words = terms(product_text(product))
+        score = sum(words.count(term) / len(words) for term in query_terms)
+        if score > 0:
+            scored.append((score, product))
+    scored.sort(key=lambda item: -item[0])
+    return [product for _, product in scored[:limit]]
+
+
+def bench_bm25(n: int = 100_000):
+    """Time the BM25 description index: build, save/load and top-5 queries against a Python scoring loop."""
+    catalog = synthetic_products(n)
+    start = time.perf_counter()
+    index = BM25Index(catalog)
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bm25.npz")
+        index.save(path)
+        start = time.perf_counter()
+        loaded = BM25Index.load(path, catalog)
+        load_s = time.perf_counter() - start
+        assert loaded is not None
+
+    queries = ["which phone has the best camera", "something with a stylus", "fast wireless charging",
+               "water resistant phone with zoom"]
+    query_us = time_per_call(lambda q: index.search(q, 5), queries, repeat=20)
+    loop_us = time_per_call(lambda q: loop_bm25(catalog, q), queries[:1], repeat=1)
+
+    print(f"catalog size:       {n} ({len(index.vocabulary)} terms, {len(index.doc_ids)} postings)")
+    print(f"build / load:       {build_s:.2f} s / {load_s * 1e3:.0f} ms")
+    print(f"bm25 top-5:         {query_us / 1e3:.2f} ms/query")
+    print(f"python loop:        {loop_us / 1e3:.0f} ms/query")
+    print(f"speedup:            {loop_us / query_us:.0f}x")
+
+
+# Labeled queries for the agent benchmarks, by the path they should take
+AGENT_QUERIES = {
+    "product": [
+        "Do you have the iPhone 15 Pro in stock?",
+        "What's the price of the Samsung Galaxy S24 Ultra?",
+        "Tell me about the Google Pixel 8 Pro features",
+        "Is the xiaomi 14 ultra available?",
+    ],
+    "order": [
+        "What's the status of my order ORD10001?",
+        "When will my order ORD10003 arrive?",
+        "Can you track order ord10002 for me",
+        "Where is my package for ORD10005?",
+    ],
+    "general": [
+        "Hello!",
+        "What are your opening hours?",
+        "Do you offer trade-in discounts?",
+        "How do I return a phone?",
+    ],
+}
+
+# Variants of stocked models that we don't sell; none may be answered with the stocked model
+UNSTOCKED_QUERIES = [
+    "Is the iPhone 15 Pro Max in stock?",
+    "How much is the Galaxy S24 FE?",
+    "Do you have the Samsung Galaxy S24+?",
+    "Is the Samsung Galaxy Z Fold available?",
+    "What's the price of the Pixel 8a?",
+    "Is the OnePlus 12R in stock?",
+]
+
+def fake_llm(latency: float = 0.05, chunk_latency: float = 0.0, **kwargs):
+    """Return a FakeChatModel scripted for the support agent's prompts."""
+    from fake_llm import support_llm
+    return support_llm(latency, chunk_latency, **kwargs)
+
+
+def bench_agent(latency: float = 0.05, rounds: int = 3):
+    """Run the labeled queries through every graph mode on the fake LLM.
+
+    Reports LLM calls per query, latency and throughput per query path, and the
+    mean wall time of each node. Caches are cleared before each query so every
+    run exercises the full graph.
+    """
+    import agent
+
+    llm = fake_llm(latency)
+    for routing in ("chained", "structured", "parallel"):
+        for pre_route in (False, True):
+            graph = agent.build_graph(routing, pre_route=pre_route, llm=llm)
+            metrics = PrometheusExporter()
+            tracer = Tracer([metrics])
+            print(f"-- {routing}{' + pre-route' if pre_route else ''}")
+            for path, queries in AGENT_QUERIES.items():
+                llm.reset_calls()
+                latencies = []
+                for _ in range(rounds):
+                    for query in queries:
+                        agent.clear_caches()
+                        trace = tracer.start(query)
+                        start = time.perf_counter()
+                        agent.process_query(query, graph=graph, callbacks=[trace])
+                        latencies.append(time.perf_counter() - start)
+                        tracer.finish(trace)
+                runs = len(latencies)
+                print(f"   {path:8s} llm calls/query {llm.calls / runs:4.2f}   "
+                      f"p50 {statistics.median(latencies) * 1e3:7.1f} ms   "
+                      f"throughput {runs / sum(latencies):6.1f} q/s")
+            nodes = ", ".join(f"{name} {histogram.sum / histogram.count * 1e3:.1f}ms"
+                              for name, histogram in sorted(metrics.node_wall.items()))
+            print(f"   per node: {nodes}")
+
+
+def bench_speculation(latency: float = 0.05, rounds: int = 3):
+    """Compare the chained and parallel graphs with and without speculative extraction on the fake LLM.
+
+    The pre-router is off so every query reaches the classifiers. Reports
+    latency and LLM calls per query path, and the speculator's saved/wasted counts.
+    """
+    import agent
+
+    llm = fake_llm(latency)
+    for routing in ("chained", "parallel"):
+        for speculate in (False, True):
+            graph = agent.build_graph(routing, pre_route=False, llm=llm, speculate=speculate)
+            agent.speculator.reset_stats()
+            print(f"-- {routing}{' + speculation' if speculate else ''}")
+            for path, queries in AGENT_QUERIES.items():
+                llm.reset_calls()
+                latencies = []
+                for _ in range(rounds):
+                    for query in queries:
+                        agent.clear_caches()
+                        start = time.perf_counter()
+                        agent.process_query(query, graph=graph)
+                        latencies.append(time.perf_counter() - start)
+                runs = len(latencies)
+                print(f"   {path:8s} llm calls/query {llm.calls / runs:4.2f}   "
+                      f"p50 {statistics.median(latencies) * 1e3:7.1f} ms")
+            if speculate:
+                stats = agent.speculator.stats()
+                print(f"   speculative calls: {stats['launched']} launched, {stats['saved']} saved, "
+                      f"{stats['wasted']} wasted, {stats['cancelled']} cancelled, {stats['missed']} missed")
+
+
+def bench_multiorder(latency: float = 0.05, orders_per_query: int = 5, rounds: int = 3):
+    """Answer a question about several orders in one graph run vs one run per order, on the fake LLM."""
+    import agent
+
+    llm = fake_llm(latency)
+    order_ids = [f"ORD{10001 + i}" for i in range(orders_per_query)]
+    bulk_query = f"Where are my orders {', '.join(order_ids)}?"
+    for routing in ("chained", "structured"):
+        graph = agent.build_graph(routing, pre_route=False, llm=llm)
+        for label, queries in (("one run per order", [f"Where is my order {order_id}?" for order_id in order_ids]),
+                               ("bulk lookup", [bulk_query])):
+            llm.reset_calls()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                agent.clear_caches()
+                for query in queries:
+                    agent.process_query(query, graph=graph)
+            elapsed = (time.perf_counter() - start) / rounds
+            print(f"{routing:10s} {label:18s} llm calls {llm.calls / rounds:4.1f}   {elapsed * 1e3:6.0f} ms "
+                  f"for {orders_per_query} orders")
+
+
+def bench_fastpath(latency: float = 0.05, rounds: int = 3):
+    """Compare template-rendered factual answers with LLM generation on the labeled queries and fake LLM."""
+    import agent
+    from templates import FastResponder
+
+    llm = fake_llm(latency)
+    queries = [query for queries in AGENT_QUERIES.values() for query in queries]
+    for fast in (False, True):
+        graph = agent.build_graph("structured", llm=llm, fast_responses=fast)
+        agent.fast_responder.reset_stats()
+        llm.reset_calls()
+        latencies = []
+        for _ in range(rounds):
+            for query in queries:
+                agent.clear_caches()
+                start = time.perf_counter()
+                agent.process_query(query, graph=graph)
+                latencies.append(time.perf_counter() - start)
+        print(f"-- structured + pre-route{' + fast responses' if fast else ''}")
+        print(f"   llm calls/query {llm.calls / len(latencies):4.2f}   "
+              f"p50 {statistics.median(latencies) * 1e3:6.1f} ms   mean {statistics.mean(latencies) * 1e3:6.1f} ms")
+        if fast:
+            print(f"   served without generation: {agent.fast_responder.stats()['rendered_fraction']:.0%}")
+            agent.fast_responder.reset_stats()
+            for query in UNSTOCKED_QUERIES:
+                agent.clear_caches()
+                agent.process_query(query, graph=graph)
+            print(f"   unstocked models templated: {agent.fast_responder.stats()['rendered']}/{len(UNSTOCKED_QUERIES)}")
+
+    responder = FastResponder()
+    product, order = agent.store.get_product("P001"), agent.find_order("ORD10001")
+    render_us = time_per_call(lambda query: responder.render(query, [product]), ["Is the iPhone 15 Pro in stock?"], repeat=10_000)
+    order_us = time_per_call(lambda query: responder.render(query, None, order), ["Where is ORD10001?"], repeat=10_000)
+    print(f"template render:    {render_us:.1f} us (product), {order_us:.1f} us (order)")
+
+
+def routing_accuracy(agent, chains, queries: Dict[str, List[str]]) -> Dict[str, float]:
+    """Run the chained classifiers and extractors on labeled queries; return accuracy and their latency."""
+    from fake_llm import ORDER_PATTERN
+    routed = extracted = 0
+    elapsed = 0.0
+    total = sum(len(labeled) for labeled in queries.values())
+    for path, labeled in queries.items():
+        for query in labeled:
+            state = agent.initial_state(query)
+            start = time.perf_counter()
+            is_product = agent.should_retrieve_product_info(state, chains=chains)["next"] == "retrieve_product"
+            is_order = agent.should_retrieve_order_info(state, chains=chains)["next"] == "retrieve_order"
+            if path == "product":
+                found = agent.find_products(agent.extract_product_name(state, chains)) or []
+                correct = any(product["name"].lower() in query.lower() for product in found)
+            elif path == "order":
+                reference = agent.parse_order_reference(agent.extract_order_reference(state, chains))
+                correct = reference.get("order_id") == ", ".join(ORDER_PATTERN.findall(query)).upper()
+            else:
+                correct = True
+            elapsed += time.perf_counter() - start
+            routed += (is_product, is_order) == (path == "product", path == "order")
+            extracted += correct
+    return {"routing": routed / total, "extraction": extracted / total, "latency_s": elapsed / total}
+
+
+def bench_tiers(small_latency: float = 0.015, large_latency: float = 0.05, rounds: int = 2):
+    """Compare model tiers: routing accuracy and latency per tier assignment on the labeled queries.
+
+    With GROQ_API_KEY set this calls the real AGENT_SMALL_MODEL and
+    AGENT_LARGE_MODEL; otherwise it uses fake models with the given latencies,
+    whose accuracy only reflects their script.
+    """
+    import agent
+
+    if os.getenv("GROQ_API_KEY"):
+        small, large = agent.get_llm("small"), agent.get_llm("large")
+        print(f"models: small={agent.MODEL_TIERS['small']}, large={agent.MODEL_TIERS['large']}")
+    else:
+        small, large = fake_llm(small_latency), fake_llm(large_latency)
+        print(f"fake models: small {small_latency * 1e3:.0f} ms, large {large_latency * 1e3:.0f} ms per call "
+              f"(set GROQ_API_KEY to measure the real models)")
+
+    queries = [query for queries in AGENT_QUERIES.values() for query in queries]
+    for label, models in (("large everywhere", {"small": large, "large": large}),
+                          ("small routing, large answers", {"small": small, "large": large}),
+                          ("small everywhere", {"small": small, "large": small})):
+        chains = agent.compile_chains(models)
+        agent.clear_caches()
+        accuracy = routing_accuracy(agent, chains, AGENT_QUERIES)
+        graph = agent.build_graph("chained", pre_route=False, llm=models)
+        latencies = []
+        for _ in range(rounds):
+            for query in queries:
+                agent.clear_caches()
+                start = time.perf_counter()
+                agent.process_query(query, graph=graph)
+                latencies.append(time.perf_counter() - start)
+        print(f"{label:30s} routing {accuracy['routing']:4.0%}   extraction {accuracy['extraction']:4.0%}   "
+              f"routing+extraction {accuracy['latency_s'] * 1e3:6.1f} ms   "
+              f"end-to-end p50 {statistics.median(latencies) * 1e3:6.1f} ms")
+
+
+def bench_hotpath(rounds: int = 200):
+    """Measure the agent's own per-request CPU time and allocations on a zero-latency fake LLM.
+
+    Uses the chained graph without the pre-router so every node runs, and
+    clears the caches before each request.
+    """
+    import agent
+
+    graph = agent.build_graph("chained", pre_route=False, llm=fake_llm(latency=0))
+    queries = AGENT_QUERIES["product"] + AGENT_QUERIES["order"] + AGENT_QUERIES["general"]
+
+    def run():
+        for query in queries:
+            agent.clear_caches()
+            agent.process_query(query, graph=graph)
+
+    run()  # warm up
+    start = time.process_time()
+    for _ in range(rounds):
+        run()
+    cpu_ms = (time.process_time() - start) / (rounds * len(queries)) * 1e3
+
+    # Peak traced memory above the baseline while serving one request
+    tracemalloc.start()
+    peaks = []
+    for query in queries:
+        agent.clear_caches()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        agent.process_query(query, graph=graph)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    print(f"cpu time:           {cpu_ms:.2f} ms/request")
+    print(f"peak allocations:   {statistics.mean(peaks) / 1024:.1f} KiB/request")
+
+
+
+def bench_ratelimit(latency: float = 0.05, rate_limit: int = 20, copies: int = 2):
+    """Send a burst of concurrent queries to a fake endpoint that answers 429 past rate_limit calls/s.
+
+    Every query is sent `copies` times at once. Without the gateway's limiter and
+    retries, calls past the limit fail. With them, every query gets an answer, and
+    the duplicate in-flight calls are coalesced.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ratelimit import LLMGateway
+    import agent
+
+    queries = [query for queries in AGENT_QUERIES.values() for query in queries] * copies
+    configs = {
+        "no limiter, no retries": LLMGateway(max_concurrency=64, max_retries=0, coalesce=False),
+        "retries only": LLMGateway(max_concurrency=64, max_retries=8, base_delay=0.2, coalesce=False),
+        "gateway": LLMGateway(max_concurrency=8, requests_per_minute=rate_limit * 60, max_retries=8,
+                              base_delay=0.2),
+    }
+    # Failed calls are the point here, so they are not turned into data-only answers
+    default_gateway, default_admission = agent.llm_gateway, agent.admission
+    agent.admission = None
+    try:
+        for name, gateway in configs.items():
+            # A fresh window per run, so earlier runs do not throttle this one
+            llm = fake_llm(latency, rate_limit=rate_limit)
+            graph = agent.build_graph("structured", pre_route=False, llm=llm)
+            agent.llm_gateway = gateway
+            agent.clear_caches()
+
+            def run(query):
+                try:
+                    return agent.process_query(query, graph=graph)
+                except Exception as e:
+                    return e
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+                results = list(executor.map(run, queries))
+            elapsed = time.perf_counter() - start
+            failed = sum(isinstance(result, Exception) for result in results)
+            stats = gateway.stats()
+            print(f"{name:24} {failed:2}/{len(queries)} failed, {llm.rejected:3} 429s, "
+                  f"{stats['retries']:3} retries, {stats['coalesced']:2} coalesced, {elapsed:.2f} s")
+    finally:
+        agent.llm_gateway, agent.admission = default_gateway, default_admission
+
+
+def bench_overload(latency: float = 0.5, clients: int = 48, deadline: float = 1.5):
+    """Send a burst of concurrent queries while the fake LLM is slow, with and without admission control.
+
+    Without it every request queues behind the LLM concurrency cap. With it,
+    requests beyond the queue or past their deadline are shed, and once the
+    latency budget is blown the rest are answered from the data alone.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from admission import AdmissionController
+    from fake_llm import ANSWER
+    from ratelimit import LLMGateway
+    import agent
+
+    queries = [query for queries in AGENT_QUERIES.values() for query in queries]
+    queries = [queries[i % len(queries)] for i in range(clients)]
+    configs = {
+        "no admission control": None,
+        "admission control": AdmissionController(max_concurrent=8, max_queue=16, timeout=deadline,
+                                                 latency_budget=deadline / 2, window=10, min_samples=4),
+    }
+    default_gateway, default_admission = agent.llm_gateway, agent.admission
+    try:
+        for name, controller in configs.items():
+            llm = fake_llm(latency)
+            graph = agent.build_graph("structured", pre_route=False, llm=llm)
+            agent.llm_gateway = LLMGateway(max_concurrency=8, coalesce=False)
+            agent.admission = controller
+            agent.clear_caches()
+
+            def run(query):
+                start = time.perf_counter()
+                try:
+                    response = agent.process_query(query, graph=graph)
+                except Exception as e:
+                    response = e
+                return response, time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                results = list(executor.map(run, queries))
+            elapsed = time.perf_counter() - start
+            latencies = sorted(seconds for _, seconds in results)
+            by_llm = sum(response == ANSWER for response, _ in results)
+            failed = sum(isinstance(response, Exception) for response, _ in results)
+            print(f"{name:22} {by_llm:2} LLM answers, {len(results) - by_llm - failed:2} data-only, {failed} failed   "
+                  f"p50 {latencies[len(latencies) // 2]:5.2f} s   max {latencies[-1]:5.2f} s   total {elapsed:5.2f} s")
+            if controller is not None:
+                stats = controller.stats()
+                print(f"{'':22} admitted {stats['admitted']}, shed {stats['shed']}, failed {stats['failed']}, "
+                      f"degraded {stats['degraded']}, overloaded {stats['overloaded']}, "
+                      f"p95 {stats['p95_latency_s']:.2f} s")
+    finally:
+        agent.llm_gateway, agent.admission = default_gateway, default_admission
+
+
+def bench_server(latency: float = 0.05, workers: int = 16, clients: int = 32, requests_per_client: int = 10):
+    """Load-test the HTTP service in-process on the fake LLM with keep-alive clients.
+
+    Every request is a distinct query (numbered), so the response cache does
+    not answer the repeats.
+    """
+    import asyncio
+    import http.client
+    from concurrent.futures import ThreadPoolExecutor
+    import agent
+    from server import AgentServer
+
+    graph = agent.build_graph(agent.ROUTING_MODE, llm=fake_llm(latency))
+    service = AgentServer(graph, workers=workers, timeout=30, keep_alive=5)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start("127.0.0.1", 0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    queries = [query for queries in AGENT_QUERIES.values() for query in queries]
+
+    def client(index: int) -> List[float]:
+        # One persistent connection per client
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        latencies = []
+        for i in range(requests_per_client):
+            query = f"{queries[(index + i) % len(queries)]} (#{index}-{i})"
+            start = time.perf_counter()
+            conn.request("POST", "/query", body=json.dumps({"query": query}),
+                         headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 200, response.status
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+        return latencies
+
+    try:
+        agent.clear_caches()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            latencies = sorted(latency for run in executor.map(client, range(clients)) for latency in run)
+        elapsed = time.perf_counter() - start
+    finally:
+        # Close the listener and the open keep-alive connections before stopping the loop
+        asyncio.run_coroutine_threadsafe(service.shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        service.executor.shutdown()
+
+    total = len(latencies)
+    print(f"workers / clients:  {workers} / {clients} ({total} requests, {latency * 1e3:.0f} ms fake LLM latency)")
+    print(f"throughput:         {total / elapsed:.1f} req/s")
+    print(f"latency p50 / p95:  {latencies[total // 2] * 1e3:.0f} / {latencies[int(total * 0.95)] * 1e3:.0f} ms")
+    print(f"server counters:    {service.health()}")
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import agent
+imported = time.perf_counter()
+deferred = [name for name in ("langgraph", "langchain_groq", "langchain_core.prompts") if name not in sys.modules]
+agent.get_agent()
+built = time.perf_counter()
+print(json.dumps({"import": imported - start, "graph": built - imported, "deferred": deferred}))
+"""
+
+
+def bench_startup(rounds: int = 5):
+    """Time a cold `import agent` and the first get_agent() call in fresh interpreters.
+
+    Runs without GROQ_API_KEY to check that importing the agent does not need it.
+    """
+    env = {key: value for key, value in os.environ.items() if key != "GROQ_API_KEY"}
+    runs = []
+    for _ in range(rounds):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], env=env, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    print(f"import agent:       {statistics.median(run['import'] for run in runs) * 1e3:.0f} ms (median of {rounds})")
+    print(f"first get_agent():  {statistics.median(run['graph'] for run in runs) * 1e3:.0f} ms")
+    print(f"deferred modules:   {', '.join(runs[0]['deferred']) or 'none'}")
+
+
+BENCHMARKS = {
+    "search": bench_search,
+    "orders": bench_orders,
+    "sqlite": bench_sqlite,
+    "catalog": bench_catalog,
+    "bm25": bench_bm25,
+    "updates": bench_updates,
+    "context": bench_context,
+    "memory": bench_memory,
+    "agent": bench_agent,
+    "hotpath": bench_hotpath,
+    "speculation": bench_speculation,
+    "multiorder": bench_multiorder,
+    "fastpath": bench_fastpath,
+    "tiers": bench_tiers,
+    "ratelimit": bench_ratelimit,
+    "overload": bench_overload,
+    "server": bench_server,
+    "startup": bench_startup,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1,180 @@
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from search import normalize
+
+# Words too common in questions and descriptions to say anything about a phone
+STOPWORDS = frozenset(
+    "a an and any are best can do does for from good has have i in is it me my of on or phone phones "
+    "some something that the this to which with you your".split()
+)
+
+# Query words (stemmed) and the catalog words that express the same feature
+SYNONYMS = {
+    "stylu": ["pen"],
+    "pencil": ["pen"],
+    "photo": ["camera", "photography"],
+    "picture": ["camera", "photography"],
+    "camera": ["photography", "optic"],
+    "charge": ["charging"],
+    "charger": ["charging"],
+    "battery": ["charging"],
+    "performance": ["snapdragon", "chip"],
+}
+
+
+def stem(token: str) -> str:
+    """Strip a plural "s" so "cameras" matches "camera" (and "stylus" becomes "stylu")."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def terms(text: str) -> List[str]:
+    """Return the stemmed index terms of a text, without stopwords."""
+    return [stem(token) for token in normalize(text) if token not in STOPWORDS]
+
+
+def product_text(product: Dict) -> str:
+    """Return the description and spec values of a product, the text the index covers."""
+    specs = product.get("specs", {})
+    values = [" ".join(value) if isinstance(value, list) else str(value) for value in specs.values()]
+    return " ".join([product.get("description", ""), *values])
+
+
+def content_hash(products: List[Dict]) -> str:
+    """Return a hash of the products' ids and indexed text, in order."""
+    digest = hashlib.sha256()
+    for product in products:
+        digest.update(f"{product['id']}\0{product_text(product)}\0".encode())
+    return digest.hexdigest()
+
+
+class BM25Index:
+    """Okapi BM25 index over product descriptions and specs, stored as sparse NumPy arrays.
+
+    Term rows are kept in CSR form (indptr/doc_ids/weights) with the BM25 weight
+    of each (term, product) pair precomputed, so scoring a query is one
+    vectorized scatter-add per query term and top-k is a partial sort.
+    """
+
+    def __init__(self, products: List[Dict], k1: float = 1.5, b: float = 0.75):
+        self.products = list(products)
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+
+        doc_terms = []
+        for product in self.products:
+            counts: Dict[int, int] = {}
+            for term in terms(product_text(product)):
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            doc_terms.append(counts)
+
+        n = len(self.products)
+        lengths = np.fromiter((sum(counts.values()) for counts in doc_terms), dtype=np.float32, count=n)
+        avg_length = float(lengths.mean()) if n else 0.0
+
+        # COO triples, then sorted by term into CSR rows
+        term_ids = np.fromiter((t for counts in doc_terms for t in counts), dtype=np.int32)
+        doc_ids = np.repeat(np.arange(n, dtype=np.int32), [len(counts) for counts in doc_terms])
+        tf = np.fromiter((c for counts in doc_terms for c in counts.values()), dtype=np.float32)
+
+        df = np.bincount(term_ids, minlength=len(self.vocabulary)).astype(np.float32)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths[doc_ids] / avg_length) if n else tf
+        weights = idf[term_ids] * tf * (k1 + 1) / (tf + norm)
+
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = doc_ids[order]
+        self.weights = weights[order].astype(np.float32)
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=self.indptr[1:])
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def query_terms(self, query: str) -> List[int]:
+        """Return the indexed term ids of a query, with synonyms added."""
+        term_ids = []
+        for token in normalize(query):
+            if token in STOPWORDS:
+                continue
+            stemmed = stem(token)
+            for term in [stemmed, *SYNONYMS.get(stemmed, ())]:
+                term_id = self.vocabulary.get(term)
+                if term_id is not None and term_id not in term_ids:
+                    term_ids.append(term_id)
+        return term_ids
+
+    def scores(self, query: str) -> np.ndarray:
+        """Return the BM25 score of every product for the query."""
+        scores = np.zeros(len(self.products), dtype=np.float32)
+        for term_id in self.query_terms(query):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # A term occurs once per product row, so plain fancy-index addition is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query: str, limit: int = 5) -> List[Dict]:
+        """Return up to limit products matching the query's feature words, best first."""
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [self.products[i] for i in ranked]
+
+    def save(self, path: str):
+        """Write the index arrays to an .npz file."""
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                product_ids=np.array([product["id"] for product in self.products]),
+                content_hash=np.array(content_hash(self.products)),
+                vocabulary=np.array(list(self.vocabulary)),
+                indptr=self.indptr,
+                doc_ids=self.doc_ids,
+                weights=self.weights,
+                params=np.array([self.k1, self.b])
+            )
+
+    @classmethod
+    def load(cls, path: str, products: List[Dict]) -> Optional["BM25Index"]:
+        """Load an index saved for the same products, or return None if it does not match them.
+
+        The products must have the same ids and the same descriptions and specs
+        as when the index was saved, so edits to the indexed text force a rebuild.
+        """
+        with np.load(path) as data:
+            by_id = {product["id"]: product for product in products}
+            product_ids = data["product_ids"].tolist()
+            if len(product_ids) != len(by_id) or any(product_id not in by_id for product_id in product_ids):
+                return None
+            ordered = [by_id[product_id] for product_id in product_ids]
+            if "content_hash" not in data.files or str(data["content_hash"]) != content_hash(ordered):
+                return None
+            index = cls.__new__(cls)
+            index.products = ordered
+            index.k1, index.b = (float(value) for value in data["params"])
+            index.vocabulary = {term: i for i, term in enumerate(data["vocabulary"].tolist())}
+            index.indptr = data["indptr"]
+            index.doc_ids = data["doc_ids"]
+            index.weights = data["weights"]
+            return index
+
+    @classmethod
+    def load_or_build(cls, products: List[Dict], path: Optional[str] = None) -> "BM25Index":
+        """Load the index from path when it matches the products, else build it (and save it to path)."""
+        if path and os.path.exists(path):
+            index = cls.load(path, products)
+            if index is not None:
+                return index
+        index = cls(products)
+        if path:
+            index.save(path)
+        return index
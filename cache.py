@@ -0,0 +1,136 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase the query and drop punctuation and extra whitespace."""
+    return " ".join(_WORD_PATTERN.findall(query.lower()))
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with a time-to-live and dependency validation.
+
+    Each entry can carry the dependencies it was computed from. When a validate
+    callback is given, an entry whose dependencies no longer validate (e.g. the
+    stock of a product it mentions changed) is dropped on lookup. When a dep_key
+    callback is given, deps must be iterables and invalidate(record) drops every
+    entry with a dependency whose dep_key is record, without scanning the cache.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300.0,
+                 validate: Optional[Callable[[Any], bool]] = None,
+                 dep_key: Optional[Callable[[Any], Hashable]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.validate = validate
+        self.dep_key = dep_key
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Any, float]]" = OrderedDict()
+        # Reverse index from record to the keys of the entries built from it
+        self._dependents: Dict[Hashable, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for the key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, deps, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+        # Validation may query the store, so it runs without holding the lock
+        valid = deps is None or self.validate is None or self.validate(deps)
+
+        with self._lock:
+            # The entry may have been replaced or dropped while it was validated
+            current = self._entries.get(key) is entry
+            if not valid:
+                if current:
+                    self._remove(key)
+                    self.invalidations += 1
+                self.misses += 1
+                return None
+            if current:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, deps: Any = None):
+        """Store a value along with the dependencies it was computed from."""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, deps, expires_at)
+            if self.dep_key is not None and deps:
+                for dep in deps:
+                    self._dependents.setdefault(self.dep_key(dep), set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        """Delete an entry and its reverse-index links; the caller holds the lock."""
+        _, deps, _ = self._entries.pop(key)
+        if self.dep_key is not None and deps:
+            for dep in deps:
+                dependents = self._dependents.get(self.dep_key(dep))
+                if dependents is not None:
+                    dependents.discard(key)
+                    if not dependents:
+                        del self._dependents[self.dep_key(dep)]
+
+    def invalidate(self, record: Hashable) -> int:
+        """Drop the entries computed from the given record and return how many were dropped."""
+        with self._lock:
+            keys = list(self._dependents.get(record, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for the key, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dependents.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss/eviction counters and the hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
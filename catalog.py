@@ -0,0 +1,229 @@
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# A dollar amount: "$900", "900", "1.2k", but not "256GB" or "6.5 inches"
+_NUMBER = r"\$?\s*(\d+(?:\.\d+)?)\s*(k)?(?!\s*(?:gb|tb|inch|\"|\.?\d))"
+# "$900" or "900 dollars", for words that are not about prices on their own
+_DOLLARS = r"(?:\$\s*(\d+(?:\.\d+)?)\s*(k)?|(\d+(?:\.\d+)?)\s*(k)?\s*(?:dollars|usd|bucks))\b"
+_PRICE_WORD = r"(?:price[sd]?|priced|costs?|costing|budget)"
+# A bare number is only a price when no other noun follows it: "under 900 with 256GB" is one,
+# "more than 2 phones", "over 1 year" and "at least 3 cameras" are not
+_AFTER_PRICE = r"(?:with|and|or|in|for|that|which|but|please|on|at|from|to|is|are|do|does|dollars|usd|bucks)\b"
+_BARE_PRICE = r"(\d+(?:\.\d+)?)\s*(k\b)?(?!\s*(?:gb|tb|inch|\"|\.?\d))(?!\s*(?!" + _AFTER_PRICE + r")[a-z])"
+_AMOUNT = r"(?:" + _DOLLARS + r"|" + _BARE_PRICE + r")"
+_PRICE_MAX_WORDS = r"(?:under|below|less than|cheaper than|up to|max(?:imum)?)"
+_PRICE_MIN_WORDS = r"(?:over|above|more than|at least|min(?:imum)?)"
+_PRICE_MAX = re.compile(
+    r"\b" + _PRICE_WORD + r"\s+" + _PRICE_MAX_WORDS + r"\s+" + _NUMBER + r"|\b" + _PRICE_MAX_WORDS + r"\s+" + _AMOUNT,
+    re.IGNORECASE
+)
+_PRICE_MIN = re.compile(
+    r"\b" + _PRICE_WORD + r"\s+" + _PRICE_MIN_WORDS + r"\s+" + _NUMBER + r"|\b" + _PRICE_MIN_WORDS + r"\s+" + _AMOUNT,
+    re.IGNORECASE
+)
+# "within" and "from" only count with a dollar amount or after a price word:
+# "a phone from 2023" is not a price filter, "prices from 500" is
+_PRICE_MAX_LOOSE = re.compile(r"\bwithin\s+" + _DOLLARS + r"|\b" + _PRICE_WORD + r"\s+within\s+" + _NUMBER, re.IGNORECASE)
+_PRICE_MIN_LOOSE = re.compile(r"\bfrom\s+" + _DOLLARS + r"|\b" + _PRICE_WORD + r"\s+from\s+" + _NUMBER, re.IGNORECASE)
+_PRICE_RANGE = re.compile(r"\bbetween\s+" + _AMOUNT + r"\s*(?:and|to|-)\s*" + _AMOUNT, re.IGNORECASE)
+_STORAGE = re.compile(r"\b(\d+)\s*(gb|tb)\b", re.IGNORECASE)
+_SCREEN = re.compile(r"\b(\d+(?:\.\d+)?)\s*(?:-?\s*inch(?:es)?|\")", re.IGNORECASE)
+_SCREEN_MIN = re.compile(r"\b(?:at least|over|above|bigger than|larger than)\s+(\d+(?:\.\d+)?)\s*(?:-?\s*inch(?:es)?|\")", re.IGNORECASE)
+_SCREEN_MAX = re.compile(r"\b(?:under|below|smaller than|less than|up to)\s+(\d+(?:\.\d+)?)\s*(?:-?\s*inch(?:es)?|\")", re.IGNORECASE)
+_IN_STOCK = re.compile(r"\b(?:in stock|available|availability)\b", re.IGNORECASE)
+_WORD = re.compile(r"[a-z]+")
+
+ATTRIBUTE_FILTERS = ("min_price", "max_price", "min_storage_gb", "min_screen", "max_screen")
+
+
+def _amount(number: str, thousands: Optional[str]) -> float:
+    return float(number) * (1000 if thousands else 1)
+
+
+def _price(match: re.Match, groups: Optional[tuple] = None) -> float:
+    """Return the amount of a price pattern match, whichever of its (number, k) group pairs matched."""
+    groups = match.groups() if groups is None else groups
+    for i in range(0, len(groups), 2):
+        if groups[i] is not None:
+            return _amount(groups[i], groups[i + 1])
+    raise ValueError("No amount in price match")
+
+
+def parse_storage_gb(value: str) -> int:
+    """Parse "256GB" or "1TB" into gigabytes (0 if unknown)."""
+    match = _STORAGE.search(value or "")
+    if not match:
+        return 0
+    return int(match.group(1)) * (1024 if match.group(2).lower() == "tb" else 1)
+
+
+def parse_screen_inches(value: str) -> float:
+    """Parse "6.1 inches" into a float (0.0 if unknown)."""
+    match = re.search(r"\d+(?:\.\d+)?", value or "")
+    return float(match.group(0)) if match else 0.0
+
+
+class ColumnarCatalog:
+    """Column-oriented copy of the product catalog for vectorized attribute filters.
+
+    Price, stock, screen size and storage are NumPy arrays; brands are encoded
+    as integer codes and color words as per-product bitmasks, so every filter
+    predicate becomes a boolean mask over the whole catalog. apply() keeps the
+    price and stock columns current from inventory change events.
+    """
+
+    def __init__(self, products: List[Dict]):
+        self.products = list(products)
+        n = len(self.products)
+        self.rows: Dict[str, int] = {p["id"]: row for row, p in enumerate(self.products)}
+        self.price = np.fromiter((p["price"] for p in self.products), dtype=np.float64, count=n)
+        self.stock = np.fromiter((p["stock"] for p in self.products), dtype=np.int64, count=n)
+        self.screen_size = np.fromiter(
+            (parse_screen_inches(p["specs"].get("screen_size", "")) for p in self.products), dtype=np.float64, count=n
+        )
+        self.storage_gb = np.fromiter(
+            (parse_storage_gb(p["specs"].get("storage", "")) for p in self.products), dtype=np.int32, count=n
+        )
+
+        self.brands: Dict[str, int] = {}
+        self.brand_code = np.fromiter(
+            (self.brands.setdefault(p["brand"].lower(), len(self.brands)) for p in self.products), dtype=np.int32, count=n
+        )
+
+        # Color words ("titanium", "black", ...) as bits, 64 per column
+        self.color_words: Dict[str, int] = {}
+        product_words = []
+        for product in self.products:
+            words = {word for color in product["specs"].get("colors", []) for word in _WORD.findall(color.lower())}
+            product_words.append([self.color_words.setdefault(word, len(self.color_words)) for word in words])
+        self.color_bits = np.zeros((n, max(1, (len(self.color_words) + 63) // 64)), dtype=np.uint64)
+        for row, bits in enumerate(product_words):
+            for bit in bits:
+                self.color_bits[row, bit // 64] |= np.uint64(1 << (bit % 64))
+
+        self._brand_pattern = self._words_pattern(self.brands)
+        self._color_pattern = self._words_pattern(self.color_words)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def apply(self, event) -> None:
+        """Update the changed product's row from an inventory ChangeEvent."""
+        row = self.rows.get(event.record_id) if event.kind == "product" else None
+        if row is None:
+            return
+        if "price" in event.changes:
+            self.price[row] = event.changes["price"][1]
+        if "stock" in event.changes:
+            self.stock[row] = event.changes["stock"][1]
+
+    @staticmethod
+    def _words_pattern(words: Dict[str, int]) -> Optional[re.Pattern]:
+        if not words:
+            return None
+        terms = sorted(words, key=len, reverse=True)
+        return re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+
+    def parse_filters(self, query: str) -> Dict[str, Any]:
+        """Extract attribute filters such as "under $900", "256GB" or "in blue" from a query."""
+        filters: Dict[str, Any] = {}
+        price_range = _PRICE_RANGE.search(query)
+        if price_range:
+            groups = price_range.groups()
+            filters["min_price"] = _price(price_range, groups[:len(groups) // 2])
+            filters["max_price"] = _price(price_range, groups[len(groups) // 2:])
+        else:
+            price_max = _PRICE_MAX.search(query) or _PRICE_MAX_LOOSE.search(query)
+            if price_max:
+                filters["max_price"] = _price(price_max)
+            price_min = _PRICE_MIN.search(query) or _PRICE_MIN_LOOSE.search(query)
+            if price_min:
+                filters["min_price"] = _price(price_min)
+
+        storage = _STORAGE.search(query)
+        if storage:
+            filters["min_storage_gb"] = parse_storage_gb(storage.group(0))
+
+        screen_min, screen_max = _SCREEN_MIN.search(query), _SCREEN_MAX.search(query)
+        if screen_min:
+            filters["min_screen"] = float(screen_min.group(1))
+        if screen_max:
+            filters["max_screen"] = float(screen_max.group(1))
+        if not screen_min and not screen_max:
+            screen = _SCREEN.search(query)
+            if screen:
+                filters["min_screen"] = float(screen.group(1))
+
+        if _IN_STOCK.search(query):
+            filters["in_stock"] = True
+        if self._brand_pattern:
+            brands = sorted({match.lower() for match in self._brand_pattern.findall(query)})
+            if brands:
+                filters["brands"] = brands
+        if self._color_pattern:
+            colors = sorted({match.lower() for match in self._color_pattern.findall(query)})
+            if colors:
+                filters["colors"] = colors
+        return filters
+
+    @staticmethod
+    def has_attribute_filters(filters: Dict[str, Any]) -> bool:
+        """Whether the filters constrain price, storage or screen size (brand/color alone do not)."""
+        return any(key in filters for key in ATTRIBUTE_FILTERS)
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Return the boolean mask of products satisfying every filter."""
+        mask = np.ones(len(self.products), dtype=bool)
+        if "min_price" in filters:
+            mask &= self.price >= filters["min_price"]
+        if "max_price" in filters:
+            mask &= self.price <= filters["max_price"]
+        if "min_storage_gb" in filters:
+            mask &= self.storage_gb >= filters["min_storage_gb"]
+        if "min_screen" in filters:
+            mask &= self.screen_size >= filters["min_screen"]
+        if "max_screen" in filters:
+            mask &= self.screen_size <= filters["max_screen"]
+        if filters.get("in_stock"):
+            mask &= self.stock > 0
+        if filters.get("brands"):
+            codes = [self.brands[brand] for brand in filters["brands"] if brand in self.brands]
+            mask &= np.isin(self.brand_code, codes)
+        for color in filters.get("colors", ()):
+            bit = self.color_words.get(color)
+            if bit is None:
+                mask[:] = False
+                break
+            mask &= (self.color_bits[:, bit // 64] & np.uint64(1 << (bit % 64))) != 0
+        return mask
+
+    @staticmethod
+    def satisfies(product: Dict, filters: Dict[str, Any]) -> bool:
+        """Check one product record against the filters, e.g. a store's current record of a match."""
+        price = product["price"]
+        if price < filters.get("min_price", price) or price > filters.get("max_price", price):
+            return False
+        specs = product["specs"]
+        storage_gb = parse_storage_gb(specs.get("storage", ""))
+        if storage_gb < filters.get("min_storage_gb", storage_gb):
+            return False
+        screen = parse_screen_inches(specs.get("screen_size", ""))
+        if screen < filters.get("min_screen", screen) or screen > filters.get("max_screen", screen):
+            return False
+        if filters.get("in_stock") and product["stock"] <= 0:
+            return False
+        if filters.get("brands") and product["brand"].lower() not in filters["brands"]:
+            return False
+        words = {word for color in specs.get("colors", []) for word in _WORD.findall(color.lower())}
+        return all(color in words for color in filters.get("colors", ()))
+
+    def filter(self, filters: Dict[str, Any], limit: Optional[int] = None) -> List[Dict]:
+        """Return the products satisfying the filters, cheapest first."""
+        indices = np.flatnonzero(self.mask(filters))
+        if limit is not None and len(indices) > limit:
+            # Partial sort: only the cheapest `limit` matches need ordering
+            indices = indices[np.argpartition(self.price[indices], limit - 1)[:limit]]
+        indices = indices[np.argsort(self.price[indices], kind="stable")]
+        return [self.products[i] for i in indices]
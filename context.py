@@ -0,0 +1,66 @@
+import heapq
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from search import normalize
+
+# Brands named individually in the remainder summary; the rest are pooled
+SUMMARY_BRANDS = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), close enough for prompt budgets."""
+    return (len(text) + 3) // 4
+
+
+def rank_products(products: List[Dict], query: str, limit: Optional[int] = None) -> List[Dict]:
+    """Return the products ordered by relevance to the query, then availability.
+
+    Relevance is the number of query words in the product name; in-stock
+    products come before sold-out ones, and ties keep the retrieval order.
+    With a limit only the best `limit` products are ordered and returned.
+    """
+    words = set(normalize(query))
+
+    def key(item):
+        position, product = item
+        overlap = len(words.intersection(normalize(product["name"]))) if words else 0
+        return (-overlap, product["stock"] <= 0, position)
+
+    items = enumerate(products)
+    ranked = sorted(items, key=key) if limit is None else heapq.nsmallest(limit, items, key=key)
+    return [product for _, product in ranked]
+
+
+def summarize_remainder(products: List[Dict]) -> str:
+    """Summarize products left out of the context, e.g. "- and 37 more Samsung models"."""
+    counts = Counter(product["brand"] for product in products).most_common()
+    parts = [f"{count} more {brand} model{'s' if count != 1 else ''}" for brand, count in counts[:SUMMARY_BRANDS]]
+    others = sum(count for _, count in counts[SUMMARY_BRANDS:])
+    if others:
+        parts.append(f"{others} more from other brands")
+    return "- and " + ", ".join(parts) + "\n"
+
+
+def build_product_context(products: List[Dict], query: str, line: Callable[[Dict], str],
+                          top_k: int = 5, token_budget: int = 400) -> str:
+    """Render the most relevant products as prompt lines, capped at top_k lines and token_budget tokens.
+
+    line renders one product. The best match is always included; products that
+    do not fit are summarized per brand on a final line.
+    """
+    lines = []
+    shown = set()
+    used = 0
+    for product in rank_products(products, query, limit=max(1, top_k)):
+        text = line(product)
+        cost = estimate_tokens(text)
+        if lines and used + cost > token_budget:
+            break
+        lines.append(text)
+        shown.add(id(product))
+        used += cost
+
+    if len(shown) < len(products):
+        lines.append(summarize_remainder([product for product in products if id(product) not in shown]))
+    return "".join(lines)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import ConfigDict, PrivateAttr
+
+class RateLimitError(Exception):
+    """429 from the fake endpoint, shaped like the Groq SDK's error (status_code, retry_after)."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit reached, retry after {retry_after:.3f}s")
+        self.retry_after = retry_after
+
+
+# A reply is fixed text (or a dict of fields for structured output), or computed from the prompt
+Reply = Union[str, Dict[str, Any], Callable[[str], Any]]
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic local stand-in for the Groq chat model.
+
+    Replies come from a script of (regex, reply) rules matched against the
+    prompt text; the first matching rule wins and default_reply is used
+    otherwise. Every call sleeps for the configured latency, so the graph can
+    be benchmarked offline with realistic round-trip times. With rate_limit set,
+    calls beyond rate_limit per rate_window seconds fail with a 429
+    RateLimitError, like a throttled API endpoint.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    script: List[Tuple[str, Reply]] = []
+    structured_script: List[Tuple[str, Reply]] = []
+    default_reply: Reply = "OK"
+    latency: float = 0.0
+    # Extra delay per streamed chunk, to simulate token generation
+    chunk_latency: float = 0.0
+    # Requests accepted per rate_window seconds (0 = unlimited)
+    rate_limit: int = 0
+    rate_window: float = 1.0
+
+    _calls: int = PrivateAttr(default=0)
+    _rejected: int = PrivateAttr(default=0)
+    _accepted: Any = PrivateAttr(default_factory=deque)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def rejected(self) -> int:
+        return self._rejected
+
+    def reset_calls(self):
+        with self._lock:
+            self._calls = 0
+            self._rejected = 0
+
+    def _admit(self):
+        """Raise RateLimitError when the sliding-window request limit is used up."""
+        if not self.rate_limit:
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self._accepted and now - self._accepted[0] >= self.rate_window:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.rate_limit:
+                self._rejected += 1
+                raise RateLimitError(self.rate_window - (now - self._accepted[0]))
+            self._accepted.append(now)
+
+    @staticmethod
+    def _prompt_text(messages: Sequence[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    @staticmethod
+    def _match(rules: List[Tuple[str, Reply]], text: str, default: Reply) -> Any:
+        reply = default
+        for pattern, candidate in rules:
+            if re.search(pattern, text, re.DOTALL):
+                reply = candidate
+                break
+        return reply(text) if callable(reply) else reply
+
+    def _reply(self, messages: Sequence[BaseMessage], structured: bool = False) -> AIMessage:
+        with self._lock:
+            self._calls += 1
+        prompt = self._prompt_text(messages)
+        if structured:
+            content = json.dumps(self._match(self.structured_script, prompt, {}))
+        else:
+            content = self._match(self.script, prompt, self.default_reply)
+        # Whitespace token counts keep the usage figures deterministic
+        input_tokens = len(prompt.split())
+        output_tokens = len(content.split())
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, structured=False, **kwargs) -> ChatResult:
+        self._admit()
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, structured))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, structured=False, **kwargs) -> ChatResult:
+        self._admit()
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, structured))])
+
+    def _stream(self, messages, stop=None, run_manager=None, structured=False, **kwargs) -> Iterator[ChatGenerationChunk]:
+        self._admit()
+        time.sleep(self.latency)
+        message = self._reply(messages, structured)
+        words = re.findall(r"\S+\s*", message.content)
+        for i, word in enumerate(words):
+            time.sleep(self.chunk_latency)
+            chunk = AIMessageChunk(content=word)
+            if i == len(words) - 1:
+                chunk.usage_metadata = message.usage_metadata
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    def with_structured_output(self, schema, **kwargs):
+        """Return a runnable producing schema instances from structured_script replies (dicts)."""
+        return self.bind(structured=True) | RunnableLambda(lambda message: schema.model_validate_json(message.content))
+
+
+# Scripted replies for the support agent's prompts, used by the benchmarks and
+# by `python server.py --fake-llm`
+PRODUCT_PATTERN = re.compile(r"iphone 15 pro|samsung galaxy s24 ultra|galaxy s24|google pixel 8 pro|pixel|xiaomi 14 ultra|oneplus 12", re.IGNORECASE)
+ORDER_PATTERN = re.compile(r"ORD\d+", re.IGNORECASE)
+ANSWER = ("Thanks for reaching out! Based on the information we have, here is what I can tell you. "
+          "Please let me know if there is anything else I can help you with today.")
+
+
+def customer_query(prompt: str) -> str:
+    """Return the customer query embedded in one of the agent's prompts."""
+    match = re.search(r"Customer query: (.*)", prompt) or re.search(r'The customer asked: "(.*)"', prompt)
+    return match.group(1) if match else prompt
+
+
+def route(prompt: str) -> Dict:
+    query = customer_query(prompt)
+    product, order = PRODUCT_PATTERN.search(query), ORDER_PATTERN.search(query)
+    if order:
+        return {"intent": "order", "order_id": ", ".join(ORDER_PATTERN.findall(query)).upper()}
+    if product:
+        return {"intent": "product", "product_name": product.group(0)}
+    return {"intent": "general"}
+
+
+def support_script() -> Dict:
+    """Scripted replies that answer the agent's classifier, extractor and response prompts."""
+    return {
+        "script": [
+            ("RETRIEVE_PRODUCT", lambda p: "RETRIEVE_PRODUCT" if PRODUCT_PATTERN.search(customer_query(p)) else "NO"),
+            ("RETRIEVE_ORDER", lambda p: "RETRIEVE_ORDER" if ORDER_PATTERN.search(customer_query(p)) else "NO"),
+            ("Extract the order number", lambda p: ", ".join(ORDER_PATTERN.findall(customer_query(p))) or "NO_ORDER_NUMBER"),
+            ("Extract the mobile phone", lambda p: (PRODUCT_PATTERN.search(customer_query(p)) or [None])[0] or customer_query(p)),
+        ],
+        "structured_script": [("route customer queries", route)],
+        "default_reply": ANSWER,
+    }
+
+
+def support_llm(latency: float = 0.05, chunk_latency: float = 0.0, **kwargs) -> FakeChatModel:
+    """Return a FakeChatModel scripted for the support agent's prompts."""
+    return FakeChatModel(latency=latency, chunk_latency=chunk_latency, **support_script(), **kwargs)
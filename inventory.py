@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class ChangeEvent(NamedTuple):
+    """One applied mutation: which record changed, its new version and the (old, new) field values."""
+    sequence: int
+    kind: str  # "product" or "order"
+    record_id: str
+    version: int
+    changes: Dict[str, Tuple[Any, Any]]
+    timestamp: float
+
+
+Subscriber = Callable[[ChangeEvent], None]
+
+
+class InventoryFeed:
+    """Applies stock, price and order status updates to the store and publishes change events.
+
+    Every applied update bumps the record's version counter and is delivered
+    to each subscriber synchronously, in order. Subscribers (the columnar
+    catalog, the response cache, ...) update only the changed record, so no
+    derived structure is rebuilt. No-op updates are not published.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.subscribers: List[Subscriber] = []
+        self.versions: Dict[Tuple[str, str], int] = {}
+        self.sequence = 0
+        self._lock = threading.RLock()
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        with self._lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self.subscribers.remove(subscriber)
+
+    def version(self, kind: str, record_id: str) -> int:
+        """Return the number of updates applied to a record (0 if never updated)."""
+        return self.versions.get((kind, record_id), 0)
+
+    def _publish(self, kind: str, record_id: str, changes: Dict[str, Tuple[Any, Any]]) -> ChangeEvent:
+        self.sequence += 1
+        version = self.versions[(kind, record_id)] = self.versions.get((kind, record_id), 0) + 1
+        event = ChangeEvent(self.sequence, kind, record_id, version, changes, time.time())
+        for subscriber in self.subscribers:
+            subscriber(event)
+        return event
+
+    def _product(self, product_id: str) -> Dict:
+        product = self.store.get_product(product_id)
+        if product is None:
+            raise KeyError(f"Unknown product: {product_id}")
+        return product
+
+    def update_stock(self, product_id: str, stock: int) -> Optional[ChangeEvent]:
+        """Set a product's stock level; returns the published event, or None if nothing changed."""
+        with self._lock:
+            old = self._product(product_id)["stock"]
+            if old == stock:
+                return None
+            self.store.update_stock(product_id, stock)
+            return self._publish("product", product_id, {"stock": (old, stock)})
+
+    def update_price(self, product_id: str, price: float) -> Optional[ChangeEvent]:
+        """Set a product's price; returns the published event, or None if nothing changed."""
+        with self._lock:
+            old = self._product(product_id)["price"]
+            if old == price:
+                return None
+            self.store.update_price(product_id, price)
+            return self._publish("product", product_id, {"price": (old, price)})
+
+    def update_order_status(self, order_id: str, status: str,
+                            tracking_number: Optional[str] = None) -> Optional[ChangeEvent]:
+        """Set an order's status (and tracking number); returns the published event, or None if nothing changed."""
+        with self._lock:
+            order = self.store.get(order_id)
+            if order is None:
+                raise KeyError(f"Unknown order: {order_id}")
+            changes = {}
+            if order["status"] != status:
+                changes["status"] = (order["status"], status)
+            if tracking_number is not None and order["tracking_number"] != tracking_number:
+                changes["tracking_number"] = (order["tracking_number"], tracking_number)
+            if not changes:
+                return None
+            self.store.update_order_status(order["order_id"], status, tracking_number)
+            return self._publish("order", order["order_id"], changes)
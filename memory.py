@@ -0,0 +1,72 @@
+import re
+import threading
+from collections import deque
+from typing import Deque, Tuple
+
+from context import estimate_tokens
+
+_SENTENCE = re.compile(r"(.+?[.!?])(?:\s|$)", re.DOTALL)
+
+
+def _clip(text: str, limit: int) -> str:
+    """Collapse whitespace and cut the text to at most limit characters."""
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def summarize_turn(user: str, assistant: str, limit: int = 160) -> str:
+    """Summarize one exchange as the question plus the first sentence of the answer."""
+    match = _SENTENCE.match(" ".join(assistant.split()))
+    answer = match.group(1) if match else assistant
+    return f"- Customer asked {_clip(user, limit // 2)!r}; agent said {_clip(answer, limit // 2)!r}"
+
+
+class ConversationMemory:
+    """Bounded memory of one conversation for follow-up questions.
+
+    The last `window` exchanges are kept verbatim (each side clipped to
+    turn_chars); older exchanges are folded into a rolling summary of one line
+    each, whose oldest lines are dropped beyond summary_tokens. The rendered
+    history therefore stays bounded however long the conversation runs.
+    """
+
+    def __init__(self, window: int = 3, turn_chars: int = 400, summary_tokens: int = 200):
+        self.window = window
+        self.turn_chars = turn_chars
+        self.summary_tokens = summary_tokens
+        self.turns: Deque[Tuple[str, str]] = deque()
+        self.summary: Deque[str] = deque()
+        self._summary_size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add(self, user: str, assistant: str):
+        """Record an exchange, summarizing the exchanges that fall out of the window."""
+        with self._lock:
+            self.turns.append((_clip(user, self.turn_chars), _clip(assistant, self.turn_chars)))
+            while len(self.turns) > self.window:
+                line = summarize_turn(*self.turns.popleft())
+                self.summary.append(line)
+                self._summary_size += estimate_tokens(line)
+            while len(self.summary) > 1 and self._summary_size > self.summary_tokens:
+                self._summary_size -= estimate_tokens(self.summary.popleft())
+
+    def clear(self):
+        with self._lock:
+            self.turns.clear()
+            self.summary.clear()
+            self._summary_size = 0
+
+    def render(self) -> str:
+        """Return the summary and recent exchanges as prompt text, or "" for a new conversation."""
+        with self._lock:
+            lines = []
+            if self.summary:
+                lines.append("Summary of earlier messages:")
+                lines.extend(self.summary)
+            for user, assistant in self.turns:
+                lines.append(f"Customer: {user}")
+                lines.append(f"Agent: {assistant}")
+            return "\n".join(lines)
@@ -0,0 +1,91 @@
+from typing import Dict, List, Optional
+
+
+class OrderRepository:
+    """Hash-indexed order store with product details joined at load time.
+
+    Lookups by order id are O(1) and secondary indexes cover customer name,
+    status and tracking number. Returned records are shared, not copied, so
+    callers must treat them as read-only and change them through the update_*
+    methods, which keep the indexes in step in O(1).
+    """
+
+    def __init__(self, orders: List[Dict], products: List[Dict]):
+        self.products_by_id: Dict[str, Dict] = {product["id"]: product for product in products}
+        self.by_id: Dict[str, Dict] = {}
+        self.by_customer: Dict[str, List[str]] = {}
+        # Order ids per status as insertion-ordered dicts, so a status change is O(1)
+        self.by_status: Dict[str, Dict[str, None]] = {}
+        self.by_tracking_number: Dict[str, str] = {}
+        for order in orders:
+            self.add(order)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def add(self, order: Dict):
+        """Join an order with its product and add it to every index."""
+        record = order.copy()
+        product = self.products_by_id.get(order["product_id"])
+        if product is not None:
+            record["product_details"] = product
+
+        order_id = record["order_id"].upper()
+        self.by_id[order_id] = record
+        self.by_customer.setdefault(record["customer_name"].lower(), []).append(order_id)
+        self.by_status.setdefault(record["status"].lower(), {})[order_id] = None
+        if record.get("tracking_number"):
+            self.by_tracking_number[record["tracking_number"].upper()] = order_id
+
+    def all_products(self) -> List[Dict]:
+        """Return every product record."""
+        return list(self.products_by_id.values())
+
+    def get_product(self, product_id: str) -> Optional[Dict]:
+        return self.products_by_id.get(product_id)
+
+    def get_products(self, product_ids: List[str]) -> List[Dict]:
+        """Return the records of the given products, in the given order."""
+        return [self.products_by_id[product_id] for product_id in product_ids if product_id in self.products_by_id]
+
+    def get(self, order_id: str) -> Optional[Dict]:
+        """Return the order with its product details, or None if it does not exist."""
+        return self.by_id.get(order_id.strip().upper())
+
+    def get_many(self, order_ids: List[str]) -> List[Dict]:
+        """Return the existing orders among order_ids, in the given order."""
+        records = (self.by_id.get(order_id.strip().upper()) for order_id in order_ids)
+        return [record for record in records if record is not None]
+
+    def find_by_customer(self, customer_name: str) -> List[Dict]:
+        """Return all orders placed by a customer (case-insensitive)."""
+        return [self.by_id[order_id] for order_id in self.by_customer.get(customer_name.strip().lower(), ())]
+
+    def find_by_status(self, status: str) -> List[Dict]:
+        """Return all orders with the given status (case-insensitive)."""
+        return [self.by_id[order_id] for order_id in self.by_status.get(status.strip().lower(), ())]
+
+    def find_by_tracking_number(self, tracking_number: str) -> Optional[Dict]:
+        """Return the order shipped under a tracking number, or None."""
+        order_id = self.by_tracking_number.get(tracking_number.strip().upper())
+        return self.by_id[order_id] if order_id else None
+
+    def update_stock(self, product_id: str, stock: int):
+        # Orders share the product record, so their joined details change with it
+        self.products_by_id[product_id]["stock"] = stock
+
+    def update_price(self, product_id: str, price: float):
+        self.products_by_id[product_id]["price"] = price
+
+    def update_order_status(self, order_id: str, status: str, tracking_number: Optional[str] = None):
+        """Change an order's status (and tracking number), moving it between the secondary indexes."""
+        order_id = order_id.strip().upper()
+        record = self.by_id[order_id]
+        self.by_status[record["status"].lower()].pop(order_id, None)
+        self.by_status.setdefault(status.lower(), {})[order_id] = None
+        record["status"] = status
+        if tracking_number is not None:
+            if record.get("tracking_number"):
+                self.by_tracking_number.pop(record["tracking_number"].upper(), None)
+            record["tracking_number"] = tracking_number
+            self.by_tracking_number[tracking_number.upper()] = order_id
@@ -0,0 +1,162 @@
+import re
+import threading
+from typing import Dict, List, Optional, Any
+
+from search import MODEL_SUFFIX_PATTERN, name_aliases
+
+# Order numbers look like ORD10001
+ORDER_ID_PATTERN = re.compile(r"\bORD\d+\b", re.IGNORECASE)
+
+# Words that make an order or product question likely, for speculative extraction
+ORDER_WORDS = re.compile(r"\b(orders?|track(ing)?|shipp(ed|ing)|deliver(y|ed)?|package|arrive)\b", re.IGNORECASE)
+PRODUCT_WORDS = re.compile(
+    r"\b(phones?|smartphones?|models?|stock|price|cost|available|availability|camera|battery|screen|storage|specs?)\b",
+    re.IGNORECASE
+)
+
+
+class PreRouter:
+    """Rule-based fast path that resolves obvious product and order queries without an LLM call.
+
+    Order numbers are found with a compiled regex and product names with a
+    gazetteer built from the catalog. With a columnar catalog, attribute queries
+    such as "phones under $900 with 256GB" are answered by its filters. Queries
+    the rules cannot resolve confidently, including a bare brand mention ("my
+    Samsung") and a catalog name continued by a model or variant word we don't
+    stock ("iPhone 15 Pro Max"), are left to the LLM nodes.
+    """
+
+    def __init__(self, products: List[Dict], catalog=None, attribute_limit: Optional[int] = 10):
+        self.catalog = catalog
+        self.attribute_limit = attribute_limit
+        self.name_index: Dict[str, List[Dict]] = {}
+        self.brand_index: Dict[str, List[Dict]] = {}
+        for product in products:
+            for alias in name_aliases(product["name"], product["brand"]):
+                self.name_index.setdefault(alias, []).append(product)
+            self.brand_index.setdefault(product["brand"].lower(), []).append(product)
+
+        self.name_pattern = self._compile(self.name_index)
+        self.brand_pattern = self._compile(self.brand_index)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _compile(index: Dict[str, List[Dict]]) -> Optional[re.Pattern]:
+        if not index:
+            return None
+        # Longest names first so "galaxy s24 ultra" wins over shorter overlaps
+        terms = sorted(index, key=len, reverse=True)
+        return re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+
+    def match_order_ids(self, query: str) -> List[str]:
+        """Return the distinct order numbers mentioned in the query, in order of appearance."""
+        order_ids = []
+        for match in ORDER_ID_PATTERN.findall(query):
+            order_id = match.upper()
+            if order_id not in order_ids:
+                order_ids.append(order_id)
+        return order_ids
+
+    def match_product_names(self, query: str) -> Optional[List[Dict]]:
+        """Return the products whose full name (or name without brand) appears in the query.
+
+        Returns None if a name is followed by another model or variant word
+        ("iPhone 15 Pro Max"): the query is about a model the names don't cover.
+        """
+        matched = []
+        if self.name_pattern:
+            for match in self.name_pattern.finditer(query):
+                if MODEL_SUFFIX_PATTERN.match(query, match.end()):
+                    return None
+                for product in self.name_index[match.group().lower()]:
+                    if product not in matched:
+                        matched.append(product)
+        return matched
+
+    def attribute_filters(self, query: str) -> Optional[Dict[str, Any]]:
+        """Return the query's filters if it constrains price, storage or screen size, else None."""
+        if self.catalog is None:
+            return None
+        filters = self.catalog.parse_filters(query)
+        return filters if self.catalog.has_attribute_filters(filters) else None
+
+    def match_attributes(self, query: str) -> Optional[List[Dict]]:
+        """Return the catalog products satisfying the query's price/storage/screen filters, or None."""
+        filters = self.attribute_filters(query)
+        if filters is None:
+            return None
+        return self.catalog.filter(filters, limit=self.attribute_limit)
+
+    def likely_order(self, query: str) -> bool:
+        """Cheap prior that the query is about an order: an order number or an order word."""
+        return bool(ORDER_ID_PATTERN.search(query) or ORDER_WORDS.search(query))
+
+    def likely_product(self, query: str) -> bool:
+        """Cheap prior that the query is about a product: a gazetteer hit or a product word."""
+        return bool(
+            (self.name_pattern and self.name_pattern.search(query))
+            or (self.brand_pattern and self.brand_pattern.search(query))
+            or PRODUCT_WORDS.search(query)
+        )
+
+    def route(self, query: str, find_orders) -> Optional[Dict[str, Any]]:
+        """Resolve the query into product_info and orders, or return None to fall back to the LLM.
+
+        find_orders is the bulk order lookup used by the agent, so the fast path
+        returns exactly what retrieve_order_info would; every order number in the
+        query is fetched in one call. "filters" holds the attribute filters the
+        products were matched with (None for named products), so callers can
+        re-check them against current records.
+        """
+        order_ids = self.match_order_ids(query)
+        if order_ids:
+            # A product named next to an order number ("my Galaxy S24 order
+            # ORD10002") describes the order, so only the orders are resolved
+            self.record(True)
+            return {"product_info": None, "orders": find_orders(order_ids), "filters": None}
+
+        product_info = self.match_product_names(query)
+        if product_info is None:
+            self.record(False)
+            return None
+        filters = None
+        if not product_info:
+            # Attribute filters also apply any brand or color mentioned. A brand
+            # alone is not enough: "return my Samsung" is not a catalog question
+            filters = self.attribute_filters(query)
+            if filters is None:
+                self.record(False)
+                return None
+            product_info = self.catalog.filter(filters, limit=self.attribute_limit)
+            if not product_info:
+                # Nothing matches: the filters may be misread, so the LLM decides
+                self.record(False)
+                return None
+
+        self.record(True)
+        return {"product_info": product_info, "orders": None, "filters": filters}
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of queries served by the rules and the resulting hit rate."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,238 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+from admission import DeadlineExceeded, check_deadline, time_left
+from context import estimate_tokens
+
+# HTTP statuses worth retrying, the same set the Groq SDK retries on its own:
+# request timeout, conflict, rate limited and transient server errors
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+# Set once the request running in this context has streamed output to its client
+_output_sent: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("output_sent", default=None)
+
+
+@contextmanager
+def streaming() -> Iterator[threading.Event]:
+    """Mark the block as streaming to a client; set the yielded event once any output has been sent.
+
+    From then on, failed LLM calls in the block (and the threads it hands its
+    context to) are not retried: a retried answer would follow the tokens
+    already shown.
+    """
+    event = threading.Event()
+    token = _output_sent.set(event)
+    try:
+        yield event
+    finally:
+        _output_sent.reset(token)
+
+
+def output_sent() -> bool:
+    """Whether the current request has already streamed output to its client."""
+    event = _output_sent.get()
+    return event is not None and event.is_set()
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at per_minute tokens a minute.
+
+    capacity bounds the burst; it defaults to one second's worth of tokens.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take amount tokens and return how many seconds to wait before using them.
+
+        The balance may go negative, so concurrent callers queue up behind each
+        other instead of all waking when the bucket refills.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class SingleFlight:
+    """Run concurrent calls with the same key once and share the result."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            # Followers wait for the leader's call only until their own deadline
+            try:
+                return future.result(timeout=time_left())
+            except FutureTimeout:
+                raise DeadlineExceeded("Request deadline exceeded waiting for a coalesced call")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """Return the HTTP status of an API error (groq, httpx or the fake model), if any."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether an LLM call failed transiently: a retryable status, a connection error or a client timeout."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Client errors (httpx, groq) do not share a base class with ConnectionError or TimeoutError
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or "Connection" in name or "Timeout" in name
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Return the server's Retry-After hint in seconds, if the error carries one."""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """Guards every LLM call: coalescing, rate limits, retries and a concurrency cap.
+
+    Identical calls in flight at the same time run once (single flight). Each
+    call then reserves one request and its estimated prompt tokens from the
+    per-minute token buckets, waits for a slot under the global concurrency
+    cap, and is retried with jittered exponential backoff (or the server's
+    Retry-After) on connection errors, timeouts and the RETRYABLE_STATUS
+    responses (429, 5xx, ...), unless the request has already streamed
+    output (see streaming). A call that would have to
+    wait past its request's deadline (see admission.deadline) raises
+    DeadlineExceeded instead of sleeping.
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 20.0, coalesce: bool = True):
+        self.semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.flights = SingleFlight() if coalesce else None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttled_s = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        """Configure from AGENT_LLM_CONCURRENCY, AGENT_LLM_RPM, AGENT_LLM_TPM and AGENT_LLM_RETRIES."""
+        return cls(
+            max_concurrency=int(os.getenv("AGENT_LLM_CONCURRENCY", "8")),
+            requests_per_minute=float(os.getenv("AGENT_LLM_RPM", "0")) or None,
+            tokens_per_minute=float(os.getenv("AGENT_LLM_TPM", "0")) or None,
+            max_retries=int(os.getenv("AGENT_LLM_RETRIES", "5"))
+        )
+
+    def invoke(self, chain, inputs: Dict[str, Any]) -> Any:
+        """Invoke a prompt | model chain on the inputs through the gateway."""
+        if self.flights is None:
+            return self._invoke(chain, inputs)
+        key = (id(chain), tuple(sorted(inputs.items())))
+        return self.flights.do(key, lambda: self._invoke(chain, inputs))
+
+    def _throttle(self, tokens: int):
+        wait = max(
+            self.requests.reserve(1) if self.requests else 0.0,
+            self.tokens.reserve(tokens) if self.tokens else 0.0
+        )
+        if wait > 0:
+            check_deadline(wait)
+            with self._lock:
+                self.throttled_s += wait
+            time.sleep(wait)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        hint = retry_after(error)
+        if hint is not None:
+            return hint + random.uniform(0, self.base_delay)
+        # Full jitter keeps retrying clients from synchronizing
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _invoke(self, chain, inputs: Dict[str, Any]) -> Any:
+        tokens = 0
+        if self.tokens is not None:
+            # Rendering the prompt costs an allocation per call, so only when there is a budget to charge
+            prompt = getattr(chain, "first", None)
+            if hasattr(prompt, "format"):
+                tokens = estimate_tokens(prompt.format(**inputs))
+        for attempt in range(self.max_retries + 1):
+            self._throttle(tokens)
+            check_deadline()
+            left = time_left()
+            if not self.semaphore.acquire(timeout=max(0.0, left) if left is not None else None):
+                raise DeadlineExceeded("Request deadline exceeded waiting for an LLM slot")
+            try:
+                with self._lock:
+                    self.calls += 1
+                return chain.invoke(inputs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries or output_sent():
+                    raise
+                delay = self._backoff(attempt, e)
+                check_deadline(delay)
+            finally:
+                self.semaphore.release()
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of calls made, retried and coalesced, and the time spent throttled."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "coalesced": self.flights.coalesced if self.flights is not None else 0,
+                "throttled_s": self.throttled_s
+            }
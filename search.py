@@ -0,0 +1,200 @@
+import heapq
+import re
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Optional, Set
+
+# Split on non-alphanumerics and on letter/digit boundaries so "Pixel8" and "pixel 8" agree
+TOKEN_PATTERN = re.compile(r"[a-z]+|\d+")
+
+# As TOKEN_PATTERN, keeping "+" so "Galaxy S24+" is told apart from "Galaxy S24"
+QUERY_TOKEN_PATTERN = re.compile(r"[a-z]+|\d+|\+")
+
+
+# Words that describe every product; "phone" would otherwise fuzzily match "iphone"
+GENERIC_WORDS = frozenset({"phone", "phones", "smartphone", "smartphones", "mobile", "mobiles", "cell", "cellphone"})
+
+# Question words that may follow a product name without changing the model
+STOPWORDS = frozenset(
+    "a an and any are at available availability be by can colors colour colours color cost costs currently do does "
+    "for from has have how i in is it its left many me much my now of on or please price prices right still stock "
+    "than that the there this to today units versus vs what when which with you your".split()
+)
+
+# A model number or variant word continuing a product name: "iPhone 15 Pro Max", "Galaxy S24 Ultra 2", "OnePlus 12+".
+# Storage sizes ("iPhone 15 Pro 256GB") pick a configuration, not another model
+MODEL_SUFFIX_PATTERN = re.compile(
+    r"\s*\+|\s+(?:\d+(?![\d.]*\s*(?:gb|tb)\b)|(?:max|plus|mini|fe|ultra|pro|lite|neo|edge|fold|flip|note|se|xl)\b)",
+    re.IGNORECASE
+)
+
+# Prices, storage sizes and screen sizes are filters, not model numbers
+ATTRIBUTE_PATTERN = re.compile(r"\$\s*\d+(?:[.,]\d+)*\s*k?|\b\d+(?:\.\d+)?\s*(?:gb|tb|-?\s*inch(?:es)?\b|\")", re.IGNORECASE)
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercase the text and split it into letter and digit tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def name_aliases(name: str, brand: str) -> List[str]:
+    """Return the lowercase product name plus the name without a leading brand, e.g. "pixel 8 pro"."""
+    name = name.lower()
+    aliases = [name]
+    brand = brand.lower()
+    if name.startswith(brand + " "):
+        remainder = name[len(brand) + 1:]
+        # "14 Ultra" alone is too ambiguous to be a confident match
+        if not remainder.split()[0].isdigit():
+            aliases.append(remainder)
+    return aliases
+
+
+@lru_cache(maxsize=1024)
+def name_pattern(name: str, brand: str) -> re.Pattern:
+    """Return a pattern matching the product's name or brandless alias as whole words."""
+    return re.compile(r"\b(?:" + "|".join(re.escape(alias) for alias in name_aliases(name, brand)) + r")\b", re.IGNORECASE)
+
+
+def mentions_product(query: str, product: Dict) -> bool:
+    """Whether the query names the product itself, not a variant of it ("iPhone 15 Pro Max" or "Galaxy S24")."""
+    return any(
+        not MODEL_SUFFIX_PATTERN.match(query, match.end())
+        for match in name_pattern(product["name"], product["brand"]).finditer(query)
+    )
+
+
+def trigrams(term: str) -> Set[str]:
+    """Return the character trigrams of a term padded with spaces."""
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    """Inverted index over product names and brands with trigram fuzzy matching.
+
+    Products get integer document ids in static rank order (shorter names first),
+    so ranking a set of matches is a matter of taking its smallest ids. Fuzzy
+    matches of out-of-vocabulary tokens are memoized in an LRU of
+    fuzzy_cache_size tokens, since raw user queries are searched too.
+    """
+
+    def __init__(self, products: List[Dict], fuzzy_threshold: float = 0.5, fuzzy_cache_size: int = 4096):
+        self.fuzzy_threshold = fuzzy_threshold
+        # Static rank: the shortest matching name is the closest match for a query
+        self.products = sorted(products, key=lambda p: (len(normalize(p["name"])), p["name"]))
+
+        postings: Dict[str, Set[int]] = {}
+        for doc_id, product in enumerate(self.products):
+            for token in normalize(f"{product['brand']} {product['name']}"):
+                postings.setdefault(token, set()).add(doc_id)
+
+        self.posting_sets = postings
+        self.posting_lists = {token: sorted(doc_ids) for token, doc_ids in postings.items()}
+
+        self.gram_index: Dict[str, Set[str]] = {}
+        self.gram_counts: Dict[str, int] = {}
+        for token in postings:
+            if token.isalpha() and len(token) >= 3:
+                grams = trigrams(token)
+                self.gram_counts[token] = len(grams)
+                for gram in grams:
+                    self.gram_index.setdefault(gram, set()).add(token)
+        self._fuzzy_terms = lru_cache(maxsize=fuzzy_cache_size)(self._match_fuzzy)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def _match_fuzzy(self, token: str) -> List[str]:
+        """Return the indexed terms most similar to a token that is not in the vocabulary."""
+        terms: List[str] = []
+        if token.isalpha() and len(token) >= 3:
+            grams = trigrams(token)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.gram_index.get(gram, ()))
+
+            best = 0.0
+            for term, count in shared.items():
+                # Dice coefficient over trigram sets
+                similarity = 2 * count / (len(grams) + self.gram_counts[term])
+                if similarity < self.fuzzy_threshold or similarity < best:
+                    continue
+                if similarity > best:
+                    best = similarity
+                    terms = []
+                terms.append(term)
+        return terms
+
+    def _resolve(self, token: str) -> Optional[Set[int]]:
+        """Return the documents matching a query token exactly or fuzzily, or None if nothing does."""
+        if token in self.posting_sets:
+            return self.posting_sets[token]
+        terms = self._fuzzy_terms(token)
+        if not terms:
+            return None
+        if len(terms) == 1:
+            return self.posting_sets[terms[0]]
+        return set().union(*(self.posting_sets[term] for term in terms))
+
+    def names_product(self, query: str) -> bool:
+        """Whether the query contains a brand or model word of the catalog, matched exactly or fuzzily."""
+        return any(
+            token.isalpha() and len(token) >= 3 and token not in GENERIC_WORDS and self._resolve(token) is not None
+            for token in normalize(query)
+        )
+
+    def lookup(self, query: str, limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """Return the products a query names, best matches first, or None if it names no product.
+
+        Unlike search(), "not in the catalog" ([] for "iPhone 16") is told apart
+        from "no product named" (None for "something with a stylus"), so callers
+        only fall back to other searches in the second case. Prices and sizes
+        ("$900", "256GB") are ignored rather than read as model numbers.
+        """
+        query = ATTRIBUTE_PATTERN.sub(" ", query)
+        if not self.names_product(query):
+            return None
+        return self.search(query, limit)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """Return the products matching the query, best matches first.
+
+        Products matching every recognised query token are returned in rank order.
+        Words that match nothing (e.g. "the", "in stock") are ignored, but an unknown
+        model number ("iPhone 16") or an unknown word continuing a matched name
+        ("iPhone 15 Pro Max", "Pixel 8a", "Galaxy S24+") means the product is not
+        in the catalog.
+        """
+        resolved: Dict[str, Set[int]] = {}
+        previous = None
+        for match in QUERY_TOKEN_PATTERN.finditer(query.lower()):
+            token = match.group()
+            if token in GENERIC_WORDS and token not in self.posting_sets:
+                previous = None
+                continue
+            doc_ids = self._resolve(token) if token != "+" else None
+            if doc_ids is not None:
+                resolved.setdefault(token, doc_ids)
+            elif token.isdigit():
+                return []
+            elif previous is not None and (previous.end() == match.start() or token not in STOPWORDS):
+                # A suffix glued to a model token ("8a", "12R") or a variant word after a name
+                return []
+            previous = match if doc_ids is not None else None
+        if not resolved:
+            return []
+
+        if len(resolved) == 1:
+            token, doc_ids = next(iter(resolved.items()))
+            # Exact single-token matches are read straight off the rank-ordered posting list
+            if token in self.posting_lists:
+                return [self.products[doc_id] for doc_id in islice(self.posting_lists[token], limit)]
+            matches = doc_ids
+        else:
+            ranked = sorted(resolved.values(), key=len)
+            matches = ranked[0].intersection(*ranked[1:])
+
+        doc_ids = sorted(matches) if limit is None else heapq.nsmallest(limit, matches)
+        return [self.products[doc_id] for doc_id in doc_ids]
@@ -0,0 +1,339 @@
+"""Headless HTTP service for the support agent.
+
+Run with: python server.py [--port 8000] [--workers 8] [--fake-llm]
+
+Endpoints (JSON in, JSON out):
+  POST /query           {"query": "..."} -> {"response": "...", "elapsed_s": ...}
+  POST /query/stream    {"query": "..."} -> chunked NDJSON: {"chunk": "..."} lines, then {"done": true}
+  GET  /health          worker pool, request and admission counters ("degraded" while overloaded)
+  GET  /metrics         Prometheus admission metrics, plus request metrics when AGENT_TRACING includes "prometheus"
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, NamedTuple, Optional, Set, Tuple
+
+import agent
+from tracing import PrometheusExporter
+
+# Requests larger than this are rejected with 413
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADER_LINES = 100
+
+# Sent instead of an unexpected error's own text, which may carry internal or upstream details
+INTERNAL_ERROR = "Internal server error"
+
+logger = logging.getLogger(__name__)
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    version: str
+    headers: Dict[str, str]
+    body: bytes
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AgentServer:
+    """Asyncio HTTP/1.1 server running agent queries on a bounded worker pool.
+
+    The event loop only parses requests and writes responses; graph runs happen
+    on `workers` threads. Connections are kept alive between requests until
+    they sit idle for keep_alive seconds, and a query that takes longer than
+    timeout seconds is answered with 504 (its worker finishes in the background).
+    shutdown() stops accepting connections and closes the open ones.
+    """
+
+    def __init__(self, graph=None, workers: int = 8, timeout: float = 30.0, keep_alive: float = 5.0):
+        self.graph = graph
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="agent-worker")
+        self.server: Optional[asyncio.AbstractServer] = None
+        # Handler task of every open connection, cancelled on shutdown
+        self._connections: Set[asyncio.Task] = set()
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> asyncio.AbstractServer:
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8000):
+        server = await self.start(host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving the support agent on http://{address[0]}:{address[1]} with {self.workers} workers")
+        try:
+            await server.serve_forever()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        """Stop accepting connections, close the open ones and stop the worker pool."""
+        if self.server is not None:
+            self.server.close()
+        connections = list(self._connections)
+        for task in connections:
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, field: str, delta: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keep_alive)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = self._keep_alive(request)
+                await self._dispatch(request, writer, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Closed by shutdown(); ending normally keeps asyncio from logging the cancelled handler
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _keep_alive(request: Request) -> bool:
+        connection = request.headers.get("connection", "").lower()
+        if request.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """Read one request, or return None when the client closed the connection."""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, path, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+        length = headers.get("content-length") or "0"
+        # isdigit() alone would accept non-ASCII digits, which int() rejects
+        if not (length.isascii() and length.isdigit()):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid Content-Length: {length!r}")
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), path.split("?", 1)[0], version, headers, body)
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        self._count("requests")
+        routes = {
+            "/query": ("POST", self._query),
+            "/query/stream": ("POST", self._stream),
+            "/health": ("GET", self._health),
+            "/metrics": ("GET", self._metrics),
+        }
+        try:
+            if request.path not in routes:
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {request.path}")
+            method, handler = routes[request.path]
+            if request.method != method:
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use {method} for {request.path}")
+            await handler(request, writer, keep_alive)
+        except HTTPError as e:
+            if e.status >= 500:
+                self._count("errors")
+            await self._send_json(writer, e.status, {"error": e.message}, keep_alive)
+        except Exception:
+            self._count("errors")
+            logger.exception("Error handling %s %s", request.method, request.path)
+            await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": INTERNAL_ERROR}, keep_alive)
+
+    @staticmethod
+    def _query_text(request: Request) -> str:
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+        query = payload.get("query") if isinstance(payload, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object with a non-empty "query" string')
+        return query
+
+    async def _run(self, fn, *args) -> Any:
+        """Run a blocking call on the worker pool, bounded by the request timeout."""
+        loop = asyncio.get_running_loop()
+        self._count("in_flight")
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self.executor, fn, *args), self.timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, f"Query did not finish within {self.timeout:g}s")
+        finally:
+            self._count("in_flight", -1)
+
+    async def _query(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        query = self._query_text(request)
+        start = time.perf_counter()
+        response = await self._run(lambda: agent.process_query(query, graph=self.graph))
+        await self._send_json(writer, HTTPStatus.OK, {
+            "response": response,
+            "elapsed_s": round(time.perf_counter() - start, 4)
+        }, keep_alive)
+
+    async def _stream(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        query = self._query_text(request)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def produce():
+            # Runs on a worker thread and hands chunks to the event loop
+            try:
+                for chunk in agent.stream_query(query, graph=self.graph):
+                    loop.call_soon_threadsafe(queue.put_nowait, {"chunk": chunk})
+                loop.call_soon_threadsafe(queue.put_nowait, {"done": True})
+            except Exception:
+                self._count("errors")
+                logger.exception("Error streaming %s", request.path)
+                loop.call_soon_threadsafe(queue.put_nowait, {"error": INTERNAL_ERROR})
+
+        self._count("in_flight")
+        loop.run_in_executor(self.executor, produce)
+        deadline = loop.time() + self.timeout
+        await self._send_head(writer, HTTPStatus.OK, "application/x-ndjson", keep_alive, chunked=True)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    self._count("timeouts")
+                    item = {"error": f"Query did not finish within {self.timeout:g}s"}
+                data = (json.dumps(item) + "\n").encode()
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await writer.drain()
+                if "chunk" not in item:
+                    break
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            self._count("in_flight", -1)
+
+    def health(self) -> Dict[str, Any]:
+        admission = agent.admission.stats() if agent.admission is not None else None
+        with self._lock:
+            return {
+                "status": "degraded" if admission and admission["overloaded"] else "ok",
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "uptime_s": round(time.monotonic() - self.started_at, 1),
+                "admission": admission
+            }
+
+    async def _health(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        await self._send_json(writer, HTTPStatus.OK, self.health(), keep_alive)
+
+    async def _metrics(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        exporter = agent.tracer.exporter(PrometheusExporter)
+        if exporter is None and agent.admission is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'Set AGENT_TRACING=prometheus to enable metrics')
+        text = exporter.render() if exporter is not None else ""
+        if agent.admission is not None:
+            text += agent.admission.render_metrics()
+        body = text.encode()
+        await self._send_head(writer, HTTPStatus.OK, "text/plain; version=0.0.4", keep_alive, length=len(body))
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_head(self, writer: asyncio.StreamWriter, status: HTTPStatus, content_type: str,
+                         keep_alive: bool, length: Optional[int] = None, chunked: bool = False):
+        headers = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            "Transfer-Encoding: chunked" if chunked else f"Content-Length: {length or 0}",
+            "Connection: keep-alive" if keep_alive else "Connection: close",
+        ]
+        if keep_alive:
+            headers.append(f"Keep-Alive: timeout={self.keep_alive:g}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: Dict, keep_alive: bool):
+        body = json.dumps(payload).encode()
+        await self._send_head(writer, status, "application/json", keep_alive, length=len(body))
+        writer.write(body)
+        await writer.drain()
+
+
+def build_server_graph(fake_llm: bool, latency: float) -> Tuple[Any, str]:
+    """Return the graph to serve and a description of its model."""
+    if fake_llm:
+        from fake_llm import support_llm
+        return agent.build_graph(agent.ROUTING_MODE, llm=support_llm(latency)), f"fake LLM ({latency:g}s latency)"
+    return agent.get_agent(), "Groq"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the support agent over HTTP.")
+    parser.add_argument("--host", default=os.getenv("AGENT_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("AGENT_SERVER_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AGENT_SERVER_WORKERS", "8")),
+                        help="threads running graph queries")
+    parser.add_argument("--timeout", type=float, default=float(os.getenv("AGENT_SERVER_TIMEOUT", "30")),
+                        help="seconds before a query is answered with 504")
+    parser.add_argument("--keep-alive", type=float, default=float(os.getenv("AGENT_SERVER_KEEP_ALIVE", "5")),
+                        help="seconds an idle connection is kept open")
+    parser.add_argument("--fake-llm", action="store_true", help="serve with the scripted offline model")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="fake LLM latency per call in seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    graph, model = build_server_graph(args.fake_llm, args.fake_latency)
+    print(f"Model: {model}")
+    server = AgentServer(graph, workers=args.workers, timeout=args.timeout, keep_alive=args.keep_alive)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,73 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class Speculator:
+    """Starts likely LLM calls before the classifier has decided they are needed.
+
+    A node calls start() with the call it will probably need, runs its own
+    classifier call meanwhile, and then resolve()s the speculative call with
+    the classifier's verdict: the result is kept when the classifier agrees,
+    and cancelled (if not yet started) or discarded otherwise. Calls run in the
+    caller's context, so callbacks and tracing still attribute them to the node.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="speculate")
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.saved = 0
+        self.wasted = 0
+        self.cancelled = 0
+        self.missed = 0
+
+    def start(self, fn: Callable[[], Any]) -> Future:
+        """Run fn in the background and return its future."""
+        with self._lock:
+            self.launched += 1
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, fn)
+
+    def resolve(self, future: Optional[Future], needed: bool) -> Optional[Any]:
+        """Return the speculative result if it is needed, else drop it; None when nothing was speculated."""
+        if future is None:
+            if needed:
+                with self._lock:
+                    self.missed += 1
+            return None
+
+        if needed:
+            with self._lock:
+                self.saved += 1
+            return future.result()
+
+        # A call that already started still costs its LLM round trip
+        cancelled = future.cancel()
+        with self._lock:
+            if cancelled:
+                self.cancelled += 1
+            else:
+                self.wasted += 1
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        """Return speculative calls launched, saved, wasted and cancelled, and needed calls that were not speculated."""
+        with self._lock:
+            return {
+                "launched": self.launched,
+                "saved": self.saved,
+                "wasted": self.wasted,
+                "cancelled": self.cancelled,
+                "missed": self.missed,
+                "precision": self.saved / self.launched if self.launched else 0.0
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.launched = 0
+            self.saved = 0
+            self.wasted = 0
+            self.cancelled = 0
+            self.missed = 0
@@ -0,0 +1,207 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    brand TEXT NOT NULL,
+    price REAL NOT NULL,
+    stock INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    specs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_brand ON products (brand COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    customer_name TEXT NOT NULL,
+    product_id TEXT NOT NULL REFERENCES products (id),
+    quantity INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    shipping_address TEXT NOT NULL,
+    tracking_number TEXT,
+    order_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_orders_tracking ON orders (tracking_number);
+CREATE INDEX IF NOT EXISTS idx_orders_product ON orders (product_id);
+"""
+
+PRODUCT_COLUMNS = ("id", "name", "brand", "price", "stock", "description", "specs")
+ORDER_COLUMNS = ("order_id", "customer_name", "product_id", "quantity", "status",
+                 "shipping_address", "tracking_number", "order_date")
+
+# Orders are always fetched with their product joined in
+ORDER_SELECT = (
+    "SELECT " + ", ".join(f"o.{column}" for column in ORDER_COLUMNS) + ", "
+    + ", ".join(f"p.{column}" for column in PRODUCT_COLUMNS)
+    + " FROM orders o LEFT JOIN products p ON p.id = o.product_id"
+)
+
+
+class SQLiteStore:
+    """SQLite-backed catalog and order store with a bounded connection pool.
+
+    Exposes the same lookup API as OrderRepository (get, find_by_customer,
+    find_by_status, find_by_tracking_number, get_product, get_products), so
+    the agent can use either backend. Every lookup reads the database, so
+    stock, price and status updates are visible without a restart. Lookups
+    check a connection out of the pool and return it, so at most pool_size
+    connections are ever open, however many threads use the store.
+    """
+
+    def __init__(self, path: str = "support.db", pool_size: int = 8):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        with self.connection() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _open(self) -> sqlite3.Connection:
+        # Pooled connections move between threads, one thread at a time
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check a connection out of the pool for the block, waiting while all pool_size are in use."""
+        self._slots.acquire()
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close the idle connections; the pool reopens connections on next use."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _fetchone(self, sql: str, params=()) -> Optional[tuple]:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params=()) -> List[tuple]:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def is_empty(self) -> bool:
+        return self._fetchone("SELECT 1 FROM products LIMIT 1") is None
+
+    def load(self, products: List[Dict], orders: List[Dict]):
+        """Insert or replace the given products and orders."""
+        with self.connection() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(json.dumps(product[c]) if c == "specs" else product[c] for c in PRODUCT_COLUMNS)
+                 for product in products]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [tuple(order[c] for c in ORDER_COLUMNS) for order in orders]
+            )
+
+    @staticmethod
+    def _product(row) -> Dict:
+        product = dict(zip(PRODUCT_COLUMNS, row))
+        product["specs"] = json.loads(product["specs"])
+        return product
+
+    def _order(self, row) -> Dict:
+        order = dict(zip(ORDER_COLUMNS, row[:len(ORDER_COLUMNS)]))
+        if row[len(ORDER_COLUMNS)] is not None:
+            order["product_details"] = self._product(row[len(ORDER_COLUMNS):])
+        return order
+
+    def all_products(self) -> List[Dict]:
+        """Return the current record of every product."""
+        return [self._product(row) for row in self._fetchall(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products")]
+
+    def get_product(self, product_id: str) -> Optional[Dict]:
+        row = self._fetchone(
+            f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products WHERE id = ?", (product_id,)
+        )
+        return self._product(row) if row else None
+
+    def get_products(self, product_ids: List[str]) -> List[Dict]:
+        """Return the current records of the given products, in the given order."""
+        if not product_ids:
+            return []
+        placeholders = ", ".join("?" * len(product_ids))
+        rows = self._fetchall(
+            f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products WHERE id IN ({placeholders})", product_ids
+        )
+        by_id = {row[0]: self._product(row) for row in rows}
+        return [by_id[product_id] for product_id in product_ids if product_id in by_id]
+
+    def get(self, order_id: str) -> Optional[Dict]:
+        """Return the order with its product details, or None if it does not exist."""
+        row = self._fetchone(
+            f"{ORDER_SELECT} WHERE o.order_id = ?", (order_id.strip().upper(),)
+        )
+        return self._order(row) if row else None
+
+    def get_many(self, order_ids: List[str]) -> List[Dict]:
+        """Return the existing orders among order_ids with their product details, in one query."""
+        order_ids = [order_id.strip().upper() for order_id in order_ids]
+        if not order_ids:
+            return []
+        placeholders = ", ".join("?" * len(order_ids))
+        rows = self._fetchall(
+            f"{ORDER_SELECT} WHERE o.order_id IN ({placeholders})", order_ids
+        )
+        by_id = {row[0]: self._order(row) for row in rows}
+        return [by_id[order_id] for order_id in order_ids if order_id in by_id]
+
+    def find_by_customer(self, customer_name: str) -> List[Dict]:
+        rows = self._fetchall(
+            f"{ORDER_SELECT} WHERE o.customer_name = ? COLLATE NOCASE", (customer_name.strip(),)
+        )
+        return [self._order(row) for row in rows]
+
+    def find_by_status(self, status: str) -> List[Dict]:
+        rows = self._fetchall(
+            f"{ORDER_SELECT} WHERE o.status = ? COLLATE NOCASE", (status.strip(),)
+        )
+        return [self._order(row) for row in rows]
+
+    def find_by_tracking_number(self, tracking_number: str) -> Optional[Dict]:
+        row = self._fetchone(
+            f"{ORDER_SELECT} WHERE o.tracking_number = ?", (tracking_number.strip().upper(),)
+        )
+        return self._order(row) if row else None
+
+    def update_stock(self, product_id: str, stock: int):
+        with self.connection() as conn, conn:
+            conn.execute("UPDATE products SET stock = ? WHERE id = ?", (stock, product_id))
+
+    def update_price(self, product_id: str, price: float):
+        with self.connection() as conn, conn:
+            conn.execute("UPDATE products SET price = ? WHERE id = ?", (price, product_id))
+
+    def update_order_status(self, order_id: str, status: str, tracking_number: Optional[str] = None):
+        with self.connection() as conn, conn:
+            conn.execute(
+                "UPDATE orders SET status = ?, tracking_number = COALESCE(?, tracking_number) WHERE order_id = ?",
+                (status, tracking_number, order_id)
+            )
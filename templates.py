@@ -0,0 +1,172 @@
+import re
+import threading
+from typing import Dict, List, Optional
+
+from search import mentions_product
+
+# Factual product questions, answered from the record alone
+STOCK_WORDS = re.compile(r"\b(in stock|stock|available|availability|have any|how many)\b", re.IGNORECASE)
+PRICE_WORDS = re.compile(r"\b(price|prices|cost|costs|how much)\b", re.IGNORECASE)
+
+# Order questions the status template answers; anything else about an order
+# ("can I add a phone to ORD10002?") goes to the LLM
+ORDER_STATUS_WORDS = re.compile(
+    r"\b(status|where|track(ing)?|ship(s|ped|ping|ment)?|dispatch(ed)?|deliver(y|ed)?|arriv(e|es|ed|al|ing)|"
+    r"when will|on (its|the) way|update)\b",
+    re.IGNORECASE
+)
+
+# Variant details a stock or price template cannot speak to, beyond the
+# catalog's own attribute filters (whose color words only cover colors we sell)
+VARIANT_WORDS = re.compile(
+    r"\b(\d+\s*(gb|tb)|red|green|blue|black|white|gold|silver|gr[ae]y|purple|pink|yellow|orange|bronze|"
+    r"titanium|unlocked|dual sim|e-?sim|refurbished|renewed|used|version|variant|edition|model|size)\b",
+    re.IGNORECASE
+)
+
+# Filters from catalog.parse_filters that don't change a stock or price answer
+PLAIN_FILTERS = frozenset({"in_stock", "brands"})
+
+# Questions that need reasoning or a conversation, never templated
+OPEN_ENDED_WORDS = re.compile(
+    r"\b(why|how (do|can|should)|compare|compared|vs|versus|better|best|recommend|suggest|should|difference|"
+    r"features?|tell me|explain|review|camera|battery|screen|specs?|colou?rs?|storage|cancel|return|refund|"
+    r"exchange|change|address|wrong|damaged|broken|problem|issue|complain)\b",
+    re.IGNORECASE
+)
+
+CLOSING = " Is there anything else I can help you with?"
+
+# Data-only answer when nothing could be matched without the LLM
+BUSY_MESSAGE = ("We're experiencing very high demand right now, so I can only look up specific products and orders. "
+                "Please include the product name or your order number (e.g. ORD10001), or try again in a few minutes.")
+
+# Precompiled templates: bound str.format methods, so rendering is one call
+PRODUCT_TEMPLATES = {
+    "in_stock": "Yes, the {name} is in stock: we have {stock} units available.".format,
+    "out_of_stock": "Sorry, the {name} is currently out of stock.".format,
+    "price": "The {name} costs ${price:,.2f}.".format,
+}
+ORDER_TEMPLATES = {
+    "shipped": "Your order {order_id} ({product_name} x{quantity}) has shipped.".format,
+    "delivered": "Your order {order_id} ({product_name} x{quantity}) has been delivered to {shipping_address}.".format,
+    # Orders looked up by customer name carry no shipping address
+    "delivered_unaddressed": "Your order {order_id} ({product_name} x{quantity}) has been delivered.".format,
+    "processing": ("Your order {order_id} ({product_name} x{quantity}), placed on {order_date}, "
+                   "is being processed and has not shipped yet.").format,
+    "pending": ("Your order {order_id} ({product_name} x{quantity}), placed on {order_date}, "
+                "is pending and has not shipped yet.").format,
+    "cancelled": "Your order {order_id} ({product_name} x{quantity}) was cancelled.".format,
+    "other": "The status of your order {order_id} ({product_name} x{quantity}) is {status}.".format,
+}
+TRACKING_TEMPLATE = " Tracking number: {tracking_number}.".format
+PRODUCT_LINE_TEMPLATE = "- {name} ({brand}): ${price:,.2f}, {availability}".format
+
+
+def order_status(order: Dict) -> str:
+    """Return the status sentence(s) of one order."""
+    product_name = order.get("product_details", {}).get("name", "Unknown product")
+    key = order["status"].lower()
+    if key == "delivered" and not order.get("shipping_address"):
+        key = "delivered_unaddressed"
+    template = ORDER_TEMPLATES.get(key, ORDER_TEMPLATES["other"])
+    status = template(product_name=product_name, **order)
+    if order["tracking_number"]:
+        status += TRACKING_TEMPLATE(**order)
+    return status
+
+
+def product_line(product: Dict) -> str:
+    """Return a one-line price and availability summary of a product."""
+    availability = f"in stock ({product['stock']} units)" if product["stock"] > 0 else "out of stock"
+    return PRODUCT_LINE_TEMPLATE(availability=availability, **product)
+
+
+def render_data_only(products: Optional[List[Dict]], orders: Optional[List[Dict]], limit: int = 5) -> str:
+    """Answer with the matched records' facts alone, for when the LLM is unavailable."""
+    parts = []
+    if orders:
+        parts.append(" ".join(order_status(order) for order in orders[:limit]))
+    if products:
+        lines = [product_line(product) for product in products[:limit]]
+        parts.append("Here is what we have:\n" + "\n".join(lines))
+    if not parts:
+        return BUSY_MESSAGE
+    return "\n\n".join(parts) + "\n\n" + CLOSING.strip()
+
+
+class FastResponder:
+    """Renders answers to purely factual questions from templates instead of an LLM generation.
+
+    Only questions about a single record qualify: the stock or price of one
+    product named in the query, or the status of one order. Anything open-ended (comparisons,
+    features, returns, ...), asking about a variant (storage, color, price
+    bounds; parsed with the catalog's filters when a catalog is given), about
+    an order but not its status, or covering several records returns None and
+    is left to the LLM. Every decision is counted, so the share of traffic
+    served without generation can be reported.
+    """
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.generated = 0
+
+    def render(self, query: str, product_info: Optional[List[Dict]] = None,
+               order_info: Optional[Dict] = None) -> Optional[str]:
+        """Return the templated answer to the query, or None if it needs the LLM."""
+        response = None
+        if not OPEN_ENDED_WORDS.search(query):
+            if product_info and len(product_info) == 1:
+                if mentions_product(query, product_info[0]) and not self.asks_variant(query):
+                    response = self.render_product(query, product_info[0])
+            elif order_info and not product_info and ORDER_STATUS_WORDS.search(query):
+                response = self.render_order(order_info)
+        self.record(response is not None)
+        return response
+
+    def asks_variant(self, query: str) -> bool:
+        """Whether the query asks about storage, color, price bounds or another detail beyond stock and price."""
+        if VARIANT_WORDS.search(query):
+            return True
+        if self.catalog is None:
+            return False
+        return any(key not in PLAIN_FILTERS for key in self.catalog.parse_filters(query))
+
+    @staticmethod
+    def render_product(query: str, product: Dict) -> Optional[str]:
+        """Answer stock and/or price questions about one product, or None for other questions."""
+        sentences = []
+        if STOCK_WORDS.search(query):
+            sentences.append(PRODUCT_TEMPLATES["in_stock" if product["stock"] > 0 else "out_of_stock"](**product))
+        if PRICE_WORDS.search(query):
+            sentences.append(PRODUCT_TEMPLATES["price"](**product))
+        return " ".join(sentences) + CLOSING if sentences else None
+
+    @staticmethod
+    def render_order(order: Dict) -> str:
+        """Answer a status question about one order."""
+        return order_status(order) + CLOSING
+
+    def record(self, rendered: bool):
+        with self._lock:
+            if rendered:
+                self.rendered += 1
+            else:
+                self.generated += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of responses rendered and generated, and the fraction served without the LLM."""
+        with self._lock:
+            total = self.rendered + self.generated
+            return {
+                "rendered": self.rendered,
+                "generated": self.generated,
+                "rendered_fraction": self.rendered / total if total else 0.0
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.rendered = 0
+            self.generated = 0
@@ -0,0 +1,270 @@
+import itertools
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, IO, List, Optional, Union
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Latency buckets in seconds, shared by every histogram
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_ids = itertools.count(1)
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[int]:
+        return list(itertools.accumulate(self.counts))
+
+
+class RequestTrace(BaseCallbackHandler):
+    """Callback handler recording node, LLM and routing spans for one request."""
+
+    def __init__(self, query: str):
+        self.request_id = next(_request_ids)
+        self.query = query
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.total_s: Optional[float] = None
+        self.cached = False
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self._node_runs: Dict[Any, tuple] = {}
+        self._llm_runs: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _node(self, name: str) -> Dict[str, Any]:
+        return self.nodes.setdefault(name, {
+            "wall_s": 0.0, "llm_s": 0.0, "llm_calls": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "route": None
+        })
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        name = kwargs.get("name")
+        # Nested runnables inherit the node metadata; only the node itself is a span
+        if metadata and name and metadata.get("langgraph_node") == name:
+            self._node_runs[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        started = self._node_runs.pop(run_id, None)
+        if started is None:
+            return
+        name, start = started
+        with self._lock:
+            node = self._node(name)
+            node["wall_s"] += time.perf_counter() - start
+            if isinstance(outputs, dict) and "next" in outputs:
+                node["route"] = outputs["next"]
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id, **kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node", "unknown")
+        self._llm_runs[run_id] = (node, time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._llm_runs.pop(run_id, None)
+        if started is None:
+            return
+        name, start = started
+        prompt_tokens, completion_tokens = token_usage(response)
+        with self._lock:
+            node = self._node(name)
+            node["llm_s"] += time.perf_counter() - start
+            node["llm_calls"] += 1
+            node["prompt_tokens"] += prompt_tokens
+            node["completion_tokens"] += completion_tokens
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._llm_runs.pop(run_id, None)
+
+    def record(self) -> Dict[str, Any]:
+        """Return the trace as a JSON-serializable record."""
+        return {
+            "request_id": self.request_id,
+            "timestamp": self.started_at,
+            "query": self.query,
+            "cached": self.cached,
+            "total_s": self.total_s,
+            "nodes": self.nodes
+        }
+
+
+def token_usage(response) -> tuple:
+    """Return (prompt_tokens, completion_tokens) from an LLMResult."""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens and response.llm_output:
+        usage = response.llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class Exporter(ABC):
+    """Receives every finished request record."""
+
+    @abstractmethod
+    def export(self, record: Dict[str, Any]):
+        """Handle one finished request record."""
+
+
+class JSONLinesExporter(Exporter):
+    """Append each request record as one JSON line to a file or stream."""
+
+    def __init__(self, target: Union[str, IO[str]] = "traces.jsonl"):
+        self.target = target
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if isinstance(self.target, str):
+                with open(self.target, "a", encoding="utf-8") as f:
+                    f.write(line)
+            else:
+                self.target.write(line)
+
+
+class PrometheusExporter(Exporter):
+    """Aggregate request records into Prometheus metrics.
+
+    render() returns the text exposition format; with a path the metrics file is
+    also rewritten after every request, for node_exporter's textfile collector.
+    """
+
+    def __init__(self, path: Optional[str] = None, prefix: str = "support_agent"):
+        self.path = path
+        self.prefix = prefix
+        self.requests = Histogram()
+        self.node_wall = defaultdict(Histogram)
+        self.node_llm = defaultdict(Histogram)
+        self.llm_calls = defaultdict(int)
+        self.tokens = defaultdict(int)
+        self.routes = defaultdict(int)
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]):
+        with self._lock:
+            self.requests.observe(record["total_s"])
+            self.cache_hits += record["cached"]
+            for name, node in record["nodes"].items():
+                self.node_wall[name].observe(node["wall_s"])
+                if node["llm_calls"]:
+                    self.node_llm[name].observe(node["llm_s"])
+                self.llm_calls[name] += node["llm_calls"]
+                self.tokens[(name, "prompt")] += node["prompt_tokens"]
+                self.tokens[(name, "completion")] += node["completion_tokens"]
+                if node["route"] is not None:
+                    self.routes[(name, node["route"])] += 1
+            text = self._render() if self.path else None
+        if text is not None:
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def render(self) -> str:
+        with self._lock:
+            return self._render()
+
+    def _histogram(self, lines: List[str], name: str, histogram: Histogram, labels: str = ""):
+        sep = "," if labels else ""
+        for bound, total in zip(histogram.buckets, histogram.cumulative()):
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+
+    def _render(self) -> str:
+        p = self.prefix
+        lines = [f"# TYPE {p}_request_seconds histogram"]
+        self._histogram(lines, f"{p}_request_seconds", self.requests)
+        lines.append(f"# TYPE {p}_cache_hits_total counter")
+        lines.append(f"{p}_cache_hits_total {self.cache_hits}")
+        lines.append(f"# TYPE {p}_node_seconds histogram")
+        for name, histogram in sorted(self.node_wall.items()):
+            self._histogram(lines, f"{p}_node_seconds", histogram, f'node="{name}"')
+        lines.append(f"# TYPE {p}_llm_seconds histogram")
+        for name, histogram in sorted(self.node_llm.items()):
+            self._histogram(lines, f"{p}_llm_seconds", histogram, f'node="{name}"')
+        lines.append(f"# TYPE {p}_llm_calls_total counter")
+        for name, calls in sorted(self.llm_calls.items()):
+            lines.append(f'{p}_llm_calls_total{{node="{name}"}} {calls}')
+        lines.append(f"# TYPE {p}_tokens_total counter")
+        for (name, kind), tokens in sorted(self.tokens.items()):
+            lines.append(f'{p}_tokens_total{{node="{name}",type="{kind}"}} {tokens}')
+        lines.append(f"# TYPE {p}_routes_total counter")
+        for (name, route), count in sorted(self.routes.items()):
+            lines.append(f'{p}_routes_total{{node="{name}",route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Creates per-request traces and hands finished records to the exporters.
+
+    When disabled, start() returns None and no callback handler is attached to
+    the graph run, so tracing costs nothing.
+    """
+
+    def __init__(self, exporters: Optional[List[Exporter]] = None, enabled: bool = True):
+        self.exporters = exporters or []
+        self.enabled = enabled and bool(self.exporters)
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """Configure exporters from AGENT_TRACING, e.g. "jsonl", "prometheus" or "jsonl,prometheus"."""
+        exporters: List[Exporter] = []
+        for name in filter(None, (part.strip() for part in os.getenv("AGENT_TRACING", "").split(","))):
+            if name == "jsonl":
+                exporters.append(JSONLinesExporter(os.getenv("AGENT_TRACE_PATH", "traces.jsonl")))
+            elif name == "prometheus":
+                exporters.append(PrometheusExporter(os.getenv("AGENT_METRICS_PATH")))
+            else:
+                raise ValueError(f"Unknown tracing exporter: {name}")
+        return cls(exporters)
+
+    def start(self, query: str) -> Optional[RequestTrace]:
+        return RequestTrace(query) if self.enabled else None
+
+    def finish(self, trace: Optional[RequestTrace], cached: bool = False):
+        if trace is None:
+            return
+        trace.total_s = time.perf_counter() - trace.start
+        trace.cached = cached
+        record = trace.record()
+        for exporter in self.exporters:
+            exporter.export(record)
+
+    def exporter(self, kind: type) -> Optional[Exporter]:
+        """Return the first exporter of the given type, e.g. to render Prometheus metrics."""
+        return next((exporter for exporter in self.exporters if isinstance(exporter, kind)), None)